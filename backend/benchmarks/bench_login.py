@@ -0,0 +1,72 @@
+"""
+Login throughput and event-loop stalls under concurrent password checks.
+
+Compares bcrypt.checkpw called inline on the event loop with verify_password,
+which runs it in the bounded bcrypt thread pool. A heartbeat task measures how
+long the loop is blocked while the logins run.
+
+Run from backend/:  python -m benchmarks.bench_login --concurrency 32 --rounds 12
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+async def heartbeat(stop: asyncio.Event, interval: float, lags: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def run(check, concurrency: int, total: int) -> tuple:
+    stop = asyncio.Event()
+    lags = []
+    beat = asyncio.create_task(heartbeat(stop, 0.005, lags))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            assert await check()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+    return total / elapsed, max(lags, default=0.0)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=12)
+    args = parser.parse_args()
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+
+    import bcrypt
+    import server
+
+    stored = await server.hash_password("senha-de-teste")
+
+    async def inline():
+        return bcrypt.checkpw(b"senha-de-teste", stored.encode())
+
+    async def pooled():
+        return await server.verify_password("senha-de-teste", stored)
+
+    print(f"rounds={args.rounds} logins={args.logins} concurrency={args.concurrency} "
+          f"workers={server.PASSWORD_HASH_WORKERS}")
+    for name, check in (("inline on loop", inline), ("thread pool", pooled)):
+        throughput, max_lag = await run(check, args.concurrency, args.logins)
+        print(f"{name:<15}: {throughput:7.1f} logins/s   max loop stall {max_lag * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
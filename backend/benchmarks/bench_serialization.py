@@ -0,0 +1,93 @@
+"""
+Per-row CPU cost of serializing list_vendas payloads.
+
+Compares the validated path (VendaConcluidaResponse per row, response_model
+validation, stdlib json) with the trusted-row path (venda_row + FastJSONResponse).
+
+Run from backend/:  python -m benchmarks.bench_serialization --rows 10000
+"""
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+import server
+
+
+def make_vendas(n: int) -> list:
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    vendas = []
+    for i in range(n):
+        itens = [
+            {"produto_id": str(uuid.uuid4()), "modelo_id": str(uuid.uuid4()), "modelo_nome": f"iPhone {12 + j}",
+             "cor": "Preto", "memoria": "128GB", "preco": 3500.0 + j}
+            for j in range(3)
+        ]
+        vendas.append({
+            "id": str(uuid.uuid4()),
+            "loja_id": "loja-bench",
+            "data": (base + timedelta(minutes=i)).isoformat(),
+            "itens": itens,
+            "valor_total": sum(item["preco"] for item in itens),
+            "subtotal": None,
+            "desconto": None,
+            "cliente_id": str(uuid.uuid4()),
+            "forma_pagamento": "pix",
+            "observacao": None,
+            "garantia_meses": 3,
+            "garantia_inicio": (base + timedelta(minutes=i)).isoformat(),
+            "garantia_ate": (base + timedelta(days=90, minutes=i)).isoformat(),
+        })
+    return vendas
+
+
+async def validated_path(vendas: list, field) -> bytes:
+    rows = [server.venda_response(v, "Cliente", "ativa") for v in vendas]
+    content = await serialize_response(field=field, response_content=rows)
+    return JSONResponse(content).body
+
+
+async def trusted_path(vendas: list) -> bytes:
+    rows = [server.venda_row(v, "Cliente", "ativa") for v in vendas]
+    return server.FastJSONResponse(rows).body
+
+
+async def measure(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        await fn()
+        best = min(best, time.process_time() - start)
+    return best
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    vendas = make_vendas(args.rows)
+    field = create_response_field(name="response", type_=List[server.VendaConcluidaResponse])
+
+    before = await measure(lambda: validated_path(vendas, field), args.repeat)
+    after = await measure(lambda: trusted_path(vendas), args.repeat)
+    encoder = "orjson" if server.orjson is not None else "json"
+    print(f"rows={args.rows} repeat={args.repeat} (best CPU time)")
+    print(f"validated + json      : {before * 1000:8.1f} ms  {before / args.rows * 1e6:6.1f} us/row")
+    print(f"trusted rows + {encoder:<7}: {after * 1000:8.1f} ms  {after / args.rows * 1e6:6.1f} us/row")
+    print(f"speedup               : {before / after:8.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
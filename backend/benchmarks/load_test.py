@@ -0,0 +1,328 @@
+"""
+Load test for the CellControl API against a local MongoDB.
+
+Starts the app with uvicorn on a throwaway database, seeds a store through the
+import endpoint, then drives concurrent traffic at login, dashboard, list and
+checkout endpoints. Prints throughput and p50/p95/p99 per scenario and writes
+the results as JSON so runs on different branches can be compared.
+
+Run from backend/:
+    python -m benchmarks.load_test --produtos 2000 --vendas 5000 --out main.json
+    python -m benchmarks.load_test --out feature.json --compare main.json
+
+Use --base-url to target a server that is already running (it must have the
+default seed users; nothing is cleaned up afterwards).
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SLUG = "isaacimports"
+SUPER_ADMIN = {"email": "superadmin@cellcontrol.com", "senha": "admin123"}
+LOJA_ADMIN = {"email": "admin@isaacimports.com", "senha": "123456"}
+
+CORES = ["Preto", "Branco", "Azul", "Verde", "Roxo", "Dourado", "Grafite"]
+MEMORIAS = ["64GB", "128GB", "256GB", "512GB"]
+FORMAS_PAGAMENTO = ["pix", "dinheiro", "cartao_credito", "cartao_debito"]
+
+
+# ---------------------------------------------------------------- server
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, db_name: str) -> tuple:
+    port = free_port()
+    env = {**os.environ, "DB_NAME": db_name, "BCRYPT_ROUNDS": str(args.bcrypt_rounds)}
+    if args.mongo_url:
+        env["MONGO_URL"] = args.mongo_url
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/api/")).status_code == 200:
+                # Seed users are created by the startup hook right before serving
+                if (await client.post("/api/auth/login", json=SUPER_ADMIN)).status_code == 200:
+                    return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError("Servidor não respondeu a tempo")
+
+
+def drop_database(args, db_name: str):
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv(BACKEND_DIR / ".env")
+    mongo = MongoClient(args.mongo_url or os.environ["MONGO_URL"])
+    mongo.drop_database(db_name)
+    mongo.close()
+
+
+# ---------------------------------------------------------------- seeding
+
+async def login(client: httpx.AsyncClient, credentials: dict) -> dict:
+    response = await client.post("/api/auth/login", json=credentials)
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['token']}"}
+
+
+async def run_import(client: httpx.AsyncClient, headers: dict, loja_id: str, data_type: str, rows: list) -> dict:
+    body = json.dumps(rows).encode()
+    start = time.perf_counter()
+    response = await client.post(
+        f"/api/admin/import/{loja_id}", params={"data_type": data_type},
+        files={"file": (f"{data_type}.json", body, "application/json")}, headers=headers
+    )
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+    while True:
+        job = (await client.get(f"/api/admin/import/jobs/{job_id}", headers=headers)).json()
+        if job["status"] in ("done", "failed"):
+            break
+        await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - start
+    if job["status"] == "failed":
+        raise RuntimeError(f"Importação de {data_type} falhou: {job.get('error')}")
+    return {"rows": len(rows), "imported": job["imported"], "seconds": round(elapsed, 3),
+            "rows_per_second": round(len(rows) / elapsed, 1)}
+
+
+def seed_rows(args) -> dict:
+    rng = random.Random(args.seed)
+    modelos = [{"id": i, "nome": f"iPhone {11 + i // 3} {['', 'Pro', 'Pro Max'][i % 3]}".strip()}
+               for i in range(args.modelos)]
+    clientes = [{"id": i, "nome": f"Cliente {i}", "cpf": f"{10_000_000_000 + i}", "whatsapp": "11999999999"}
+                for i in range(args.clientes)]
+    produtos = [{"id": i, "modelo_id": rng.randrange(args.modelos), "cor": rng.choice(CORES),
+                 "memoria": rng.choice(MEMORIAS), "bateria": rng.randint(80, 100),
+                 "imei": f"35{i:013d}", "preco": rng.randrange(1500, 9000, 50)}
+                for i in range(args.produtos)]
+    inicio = datetime.now(timezone.utc) - timedelta(days=365)
+    vendas = []
+    for i in range(args.vendas):
+        itens = []
+        for _ in range(rng.randint(1, 3)):
+            # modelo_id is the seed's old id; the importer maps it to the new modelo
+            modelo = rng.choice(modelos)
+            itens.append({"id": str(uuid.uuid4()), "modelo_id": modelo["id"], "modelo_nome": modelo["nome"],
+                          "cor": rng.choice(CORES), "memoria": rng.choice(MEMORIAS),
+                          "preco": rng.randrange(1500, 9000, 50)})
+        vendas.append({
+            "cliente_id": rng.randrange(args.clientes),
+            "valor_total": sum(item["preco"] for item in itens),
+            "forma_pagamento": rng.choice(FORMAS_PAGAMENTO),
+            "data": (inicio + timedelta(minutes=rng.randrange(365 * 24 * 60))).isoformat(),
+            "itens": json.dumps(itens),
+        })
+    return {"modelos": modelos, "clientes": clientes, "produtos": produtos, "vendas": vendas}
+
+
+# ---------------------------------------------------------------- load
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank method
+    index = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    values = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 2)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "max_ms": ms(values[-1]) if values else 0.0,
+    }
+
+
+async def drive(make_request, concurrency: int, duration: float) -> dict:
+    """Run `make_request` from `concurrency` workers for `duration` seconds (or until it returns None)."""
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            response = await make_request()
+            if response is None:
+                return
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def seeded_months(vendas: list) -> list:
+    """Distinct "YYYY-MM" months the seeded sales fall in."""
+    return sorted({venda["data"][:7] for venda in vendas})
+
+
+def scenarios(client: httpx.AsyncClient, loja_headers: dict, cliente_ids: list, disponiveis: list,
+              meses: list, rng) -> dict:
+    base = f"/api/loja/{SLUG}"
+
+    def get(path, **params):
+        return lambda: client.get(base + path, params=params, headers=loja_headers)
+
+    async def checkout():
+        if len(disponiveis) < 3:
+            return None
+        produtos = [disponiveis.pop() for _ in range(rng.randint(1, 3))]
+        return await client.post(f"{base}/vendas", json={
+            "cliente_id": rng.choice(cliente_ids), "produtos": produtos, "forma_pagamento": rng.choice(FORMAS_PAGAMENTO)
+        }, headers=loja_headers)
+
+    return {
+        "login": lambda: client.post("/api/auth/login", json=LOJA_ADMIN),
+        "dashboard": get("/dashboard"),
+        "dashboard_mes": lambda: client.get(
+            f"{base}/dashboard", params={"mes": rng.choice(meses)}, headers=loja_headers
+        ),
+        "list_produtos": get("/produtos", vendido="false"),
+        "list_clientes": get("/clientes"),
+        "list_modelos": get("/modelos"),
+        "list_vendas_page": get("/vendas", limit=100),
+        "checkout": checkout,
+    }
+
+
+# ---------------------------------------------------------------- report
+
+def git_info() -> dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {"commit": git("rev-parse", "HEAD"), "branch": git("rev-parse", "--abbrev-ref", "HEAD")}
+
+
+def print_report(results: dict, baseline: dict = None):
+    print(f"\n{'scenario':<18}{'req':>7}{'err':>6}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, stats in results["scenarios"].items():
+        line = (f"{name:<18}{stats['requests']:>7}{stats['errors']:>6}{stats['throughput_rps']:>9.1f}"
+                f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}")
+        previous = (baseline or {}).get("scenarios", {}).get(name)
+        if previous and previous["p95_ms"]:
+            line += f"   p95 {(stats['p95_ms'] / previous['p95_ms'] - 1) * 100:+.0f}%"
+            if previous["throughput_rps"]:
+                line += f"  rps {(stats['throughput_rps'] / previous['throughput_rps'] - 1) * 100:+.0f}%"
+        print(line)
+    for data_type, stats in results["import"].items():
+        print(f"import {data_type:<11}{stats['rows']:>7} rows {stats['seconds']:>8.2f}s {stats['rows_per_second']:>9.1f} rows/s")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--base-url", help="Use a running server instead of starting one")
+    parser.add_argument("--mongo-url", help="MongoDB for the spawned server (default: MONGO_URL from backend/.env)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--bcrypt-rounds", type=int, default=int(os.environ.get("BCRYPT_ROUNDS", "12")))
+    parser.add_argument("--modelos", type=int, default=30)
+    parser.add_argument("--clientes", type=int, default=500)
+    parser.add_argument("--produtos", type=int, default=2000)
+    parser.add_argument("--vendas", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per scenario")
+    parser.add_argument("--scenarios", help="Comma-separated subset to run")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="Results file (default: load-test-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to diff against")
+    args = parser.parse_args()
+
+    db_name = f"cellcontrol_bench_{uuid.uuid4().hex[:8]}"
+    process = None
+    base_url = args.base_url
+    if not base_url:
+        process, base_url = start_server(args, db_name)
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+            await wait_ready(client)
+            admin_headers = await login(client, SUPER_ADMIN)
+            loja_headers = await login(client, LOJA_ADMIN)
+            lojas = (await client.get("/api/admin/lojas", headers=admin_headers)).json()
+            loja_id = next(loja["id"] for loja in lojas if loja["slug"] == SLUG)
+
+            print(f"Semeando {SLUG}: {args.modelos} modelos, {args.clientes} clientes, "
+                  f"{args.produtos} produtos, {args.vendas} vendas")
+            rows = seed_rows(args)
+            imports = {}
+            for data_type in ("modelos", "clientes", "produtos", "vendas"):
+                imports[data_type] = await run_import(client, admin_headers, loja_id, data_type, rows[data_type])
+
+            base = f"/api/loja/{SLUG}"
+            cliente_ids = [c["id"] for c in (await client.get(f"{base}/clientes", headers=loja_headers)).json()]
+            disponiveis = [p["id"] for p in (await client.get(
+                f"{base}/produtos", params={"vendido": "false"}, headers=loja_headers)).json()]
+            rng.shuffle(disponiveis)
+
+            available = scenarios(client, loja_headers, cliente_ids, disponiveis, seeded_months(rows["vendas"]), rng)
+            selected = args.scenarios.split(",") if args.scenarios else list(available)
+            results = {"scenarios": {}}
+            for name in selected:
+                print(f"  {name} ...", flush=True)
+                results["scenarios"][name] = await drive(available[name], args.concurrency, args.duration)
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=30)
+            drop_database(args, db_name)
+
+    results.update({
+        "import": imports,
+        "meta": {
+            **git_info(),
+            "at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "params": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        },
+    })
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(results, baseline)
+    out = Path(args.out or f"load-test-{(results['meta']['commit'] or 'local')[:8]}.json")
+    out.write_text(json.dumps(results, indent=2))
+    print(f"\nResultados salvos em {out}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
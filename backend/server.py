@@ -1,20 +1,60 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Query, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 import os
 import logging
+import asyncio
+import contextvars
+import itertools
+import tempfile
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, TypeAdapter, ValidationError
+from typing import Awaitable, Callable, List, Optional, Union, get_args, get_origin
 import uuid
 from datetime import datetime, timezone, timedelta
 import jwt
+import bcrypt
+import hmac
 import json
 import re
+import time
+import base64
+import hashlib
+import csv
+import io
+import zlib
 import aiofiles
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:  # falls back to stdlib json
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # "br" is not offered
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # "zstd" is not offered
+    zstandard = None
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import HTMLRenderer, SpeedscopeRenderer
+    from pyinstrument.session import Session
+except ImportError:  # request profiling is unavailable
+    Profiler = None
 
 ROOT_DIR = Path(__file__).parent
 UPLOAD_DIR = ROOT_DIR / "uploads"
@@ -22,9 +62,67 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 
 load_dotenv(ROOT_DIR / '.env')
 
+# Prometheus metrics
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests", ["method", "route", "status"])
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being served", ["method"])
+MONGO_LATENCY = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency", ["collection", "command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+MONGO_FAILURES = Counter("mongodb_command_failures_total", "Failed MongoDB commands", ["collection", "command"])
+
+# Durations (µs) of the Mongo commands issued by the current request; Motor copies the
+# context into its executor threads, so the listener sees the request's list.
+db_query_stats = contextvars.ContextVar("db_query_stats", default=None)
+# ASGI scope of the current request, for attributing slow commands to a route
+request_scope = contextvars.ContextVar("request_scope", default=None)
+
+# Slow Mongo command recorder
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+SLOW_QUERY_LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE', '200'))
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', '1').lower() not in ('0', 'false', 'no')
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.environ.get('SLOW_QUERY_EXPLAIN_INTERVAL', '60'))
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every driver command per collection. Called from driver threads."""
+
+    def __init__(self):
+        self.pending = {}
+
+    @staticmethod
+    def collection_of(event) -> str:
+        if event.command_name == "getMore":
+            return event.command.get("collection", "")
+        target = event.command.get(event.command_name)
+        return target if isinstance(target, str) else ""
+
+    def started(self, event):
+        self.pending[(event.connection_id, event.request_id)] = (self.collection_of(event), event.command)
+
+    def record(self, event) -> str:
+        collection, command = self.pending.pop((event.connection_id, event.request_id), ("", None))
+        MONGO_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+        stats = db_query_stats.get()
+        if stats is not None:
+            stats.append(event.duration_micros)
+        if event.duration_micros >= SLOW_QUERY_MS * 1000 and collection and command is not None:
+            slow_queries.observe(collection, event.command_name, command, event.duration_micros)
+        return collection
+
+    def succeeded(self, event):
+        self.record(event)
+
+    def failed(self, event):
+        collection = self.record(event)
+        MONGO_FAILURES.labels(collection, event.command_name).inc()
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandMetrics()])
 db = client[os.environ['DB_NAME']]
 
 # JWT Config
@@ -32,6 +130,48 @@ JWT_SECRET = os.environ.get('JWT_SECRET', 'cellcontrol_secret_key_2024')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+# Password hashing (bcrypt runs in a bounded thread pool, off the event loop)
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+
+# Dashboard response cache
+DASHBOARD_CACHE_SIZE = int(os.environ.get('DASHBOARD_CACHE_SIZE', '512'))
+DASHBOARD_CACHE_TTL = float(os.environ.get('DASHBOARD_CACHE_TTL', '30'))
+
+# Background tasks (kept referenced until they finish)
+background_tasks = set()
+
+def spawn_background(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+# Fast JSON path for the heavy list endpoints (set to 0 to go back to response_model validation)
+FAST_JSON_LISTS = os.environ.get('FAST_JSON_LISTS', '1').lower() not in ('0', 'false', 'no')
+
+# Response compression (encodings in server preference order)
+COMPRESSION_ENCODINGS = [e.strip() for e in os.environ.get('COMPRESSION_ENCODINGS', 'zstd,br,gzip').split(',') if e.strip()]
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '4'))
+ZSTD_LEVEL = int(os.environ.get('ZSTD_LEVEL', '3'))
+
+# On-demand request profiling (super admin, ?profile=1 or X-Profile: 1)
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', '0.001'))
+PROFILE_STORE_SIZE = int(os.environ.get('PROFILE_STORE_SIZE', '20'))
+
+# Store (loja) resolution cache
+LOJA_CACHE_SIZE = int(os.environ.get('LOJA_CACHE_SIZE', '1024'))
+LOJA_CACHE_TTL = float(os.environ.get('LOJA_CACHE_TTL', '60'))
+
+# Verified JWT cache (entries never outlive the token's exp)
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '4096'))
+TOKEN_CACHE_TTL = float(os.environ.get('TOKEN_CACHE_TTL', '300'))
+# How long a worker may keep accepting a token revoked on another worker
+REVOCATION_CACHE_TTL = float(os.environ.get('REVOCATION_CACHE_TTL', '30'))
+
 security = HTTPBearer()
 
 # Create the main app
@@ -235,7 +375,7 @@ class VendaConcluida(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     loja_id: str
     data: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    itens: str
+    itens: List[VendaItem]
     valor_total: float
     subtotal: Optional[float] = None  # Total before discount
     desconto: Optional[float] = None  # Discount value in BRL
@@ -270,6 +410,84 @@ class AdminDashboardStats(BaseModel):
     valor_total_global: float
     lojas: List[LojaWithStats]
 
+# ============== SERIALIZATION ==============
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class FastJSONResponse(Response):
+    """JSON response encoded with orjson when available."""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, default=json_default)
+        return json.dumps(content, default=json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+PASSTHROUGH_TYPES = (str, int, float, bool, type(None))
+
+def field_coercer(annotation):
+    """
+    Coerce one stored value the way the response model would serialize it. Values whose
+    type the annotation names exactly are kept as-is; anything else (numeric strings,
+    ints in float fields, ISO strings for datetimes) goes through a pydantic TypeAdapter
+    in JSON mode. A value the model would reject becomes None.
+    """
+    args = get_args(annotation) if get_origin(annotation) is Union else (annotation,)
+    keep = tuple(t for t in args if t in PASSTHROUGH_TYPES)
+    adapter = TypeAdapter(annotation)
+
+    def coerce(value):
+        if type(value) in keep:
+            return value
+        try:
+            return adapter.dump_python(adapter.validate_python(value), mode="json")
+        except ValidationError:
+            return None
+    return coerce
+
+def trusted_serializer(model):
+    """
+    Build a function that shapes a stored document like `model` would serialize it,
+    without building the model. Stored values are coerced to the field types
+    (field_coercer); missing fields get the model's static default, or None when the field
+    is required or has a default_factory (a list must not mint a new id per request).
+    Unknown fields are dropped; overrides are taken as already serialized.
+    """
+    fields = []
+    for name, field in model.model_fields.items():
+        default = None if field.is_required() or field.default_factory else field.default
+        fields.append((name, field_coercer(field.annotation), default))
+
+    def serialize(row: dict, **overrides) -> dict:
+        out = {}
+        for name, coerce, default in fields:
+            if name in overrides:
+                out[name] = overrides[name]
+            elif name in row:
+                out[name] = coerce(row[name])
+            else:
+                out[name] = default
+        return out
+    return serialize
+
+def list_response(response: Response, model, rows: list):
+    """
+    Return already-shaped rows. On the fast path they skip the response_model round trip
+    and are encoded by orjson; headers set on `response` (ETag, cursors) are carried over.
+    """
+    if FAST_JSON_LISTS:
+        return FastJSONResponse(rows, headers=dict(response.headers))
+    return [model(**row) for row in rows]
+
+MODELO_ROW = trusted_serializer(ModeloWithQuantity)
+PRODUTO_ROW = trusted_serializer(ProdutoWithModelo)
+CLIENTE_ROW = trusted_serializer(Cliente)
+VENDA_ROW = trusted_serializer(VendaConcluidaResponse)
+VENDA_ITEM_ROW = trusted_serializer(VendaItem)
+
 # ============== HELPER FUNCTIONS ==============
 
 def create_token(user_id: str, user_email: str, role: str, loja_id: Optional[str] = None) -> str:
@@ -278,18 +496,57 @@ def create_token(user_id: str, user_email: str, role: str, loja_id: Optional[str
         "user_email": user_email,
         "role": role,
         "loja_id": loja_id,
+        "iat": time.time(),
         "exp": datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expirado")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Token inválido")
+# Token revocation (logout everywhere) lives in usuarios.revoked_at, shared by every worker
+# and kept across restarts. Each process caches it per user for REVOCATION_CACHE_TTL
+# seconds, so a revocation made on another worker is enforced here within that window.
+REVOKED_ALL = float("inf")  # user removed: none of its tokens is accepted
+
+async def revoke_user_tokens(user_id: str):
+    """Reject every token issued to `user_id` up to now."""
+    revoked_at = time.time()
+    result = await db.usuarios.update_one({"id": user_id}, {"$set": {"revoked_at": revoked_at}})
+    revocation_cache.set(user_id, revoked_at if result.matched_count else REVOKED_ALL)
+
+async def user_revoked_at(user_id: str) -> float:
+    revoked_at = revocation_cache.get(user_id)
+    if revoked_at is None:
+        usuario = await db.usuarios.find_one({"id": user_id}, {"_id": 0, "revoked_at": 1})
+        revoked_at = REVOKED_ALL if usuario is None else usuario.get("revoked_at", 0.0)
+        revocation_cache.set(user_id, revoked_at)
+    return revoked_at
+
+async def user_tokens_revoked(payload: dict) -> bool:
+    revoked_at = await user_revoked_at(payload.get("user_id"))
+    return revoked_at > 0 and payload.get("iat", 0) <= revoked_at
+
+# Runs on every request, cached or not: keep it to a cache lookup in the common case
+token_revocation_check: Callable[[dict], Awaitable[bool]] = user_tokens_revoked
+
+def set_token_revocation_check(check: Callable[[dict], Awaitable[bool]]):
+    global token_revocation_check
+    token_revocation_check = check
+
+async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    token = credentials.credentials
+    payload = token_cache.get(token)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token expirado")
+        except jwt.InvalidTokenError:
+            raise HTTPException(status_code=401, detail="Token inválido")
+        ttl = min(TOKEN_CACHE_TTL, payload["exp"] - time.time()) if "exp" in payload else TOKEN_CACHE_TTL
+        if ttl > 0:
+            token_cache.set(token, payload, ttl)
+    if await token_revocation_check(payload):
+        raise HTTPException(status_code=401, detail="Token revogado")
+    return payload
 
 def require_super_admin(payload: dict = Depends(verify_token)):
     if payload.get("role") != "super_admin":
@@ -303,11 +560,189 @@ def require_loja_access(payload: dict = Depends(verify_token)):
         raise HTTPException(status_code=403, detail="Acesso negado. Usuário não vinculado a uma loja.")
     return payload
 
+class TTLCache:
+    """Bounded in-memory LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        entry = self._data.pop(key, None)
+        return entry[1] if entry else None
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+token_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+# user_id -> usuarios.revoked_at (0.0 when never revoked)
+revocation_cache = TTLCache(TOKEN_CACHE_SIZE, REVOCATION_CACHE_TTL)
+
+# Active stores, keyed by ("slug", slug) and ("id", id)
+loja_cache = TTLCache(maxsize=LOJA_CACHE_SIZE, ttl=LOJA_CACHE_TTL)
+
+def cache_loja(loja: dict):
+    if loja.get("ativo", True):
+        loja_cache.set(("slug", loja["slug"]), loja)
+        loja_cache.set(("id", loja["id"]), loja)
+
+def invalidate_loja(loja_id: str, slug: Optional[str] = None):
+    cached = loja_cache.pop(("id", loja_id))
+    if cached:
+        loja_cache.pop(("slug", cached["slug"]))
+    if slug:
+        loja_cache.pop(("slug", slug))
+
+# Dashboard responses keyed by the store's loja_versions counters (shared by every worker)
+# and the month. Any write bumps a counter, which orphans every cached month at once;
+# orphans age out of the LRU.
+dashboard_cache = TTLCache(maxsize=DASHBOARD_CACHE_SIZE, ttl=DASHBOARD_CACHE_TTL)
+
+# Counters the dashboard depends on; "dashboard" is bumped by repairs that change its
+# figures without writing to any list
+DASHBOARD_VERSION_DEPENDENCIES = ("modelos", "produtos", "clientes", "vendas", "dashboard")
+
+async def dashboard_cache_key(loja_id: str, mes: Optional[str]) -> tuple:
+    versions = await db.loja_versions.find_one({"loja_id": loja_id}, {"_id": 0}) or {}
+    counters = tuple(versions.get(name, 0) for name in DASHBOARD_VERSION_DEPENDENCIES)
+    return (loja_id, versions.get("epoch", ""), counters, mes or "")
+
+async def invalidate_dashboard(loja_id: Optional[str] = None):
+    """Orphan cached dashboards on every worker after a write that bumps no list version."""
+    if loja_id is not None:
+        await mark_loja_changed(loja_id, "dashboard")
+        return
+    await db.loja_versions.update_many({}, {"$inc": {"dashboard": 1}})
+    # Stores without a loja_versions doc yet share the empty key
+    dashboard_cache.clear()
+
+# List payloads and the per-store write counters (loja_versions) they depend on
+LIST_VERSION_DEPENDENCIES = {
+    "modelos": ("modelos", "produtos"),
+    "produtos": ("produtos", "modelos"),
+    "clientes": ("clientes",),
+    "vendas": ("vendas", "clientes"),
+}
+
+# garantia_proxima when none of the store's warranties is still running
+GARANTIA_NENHUMA = "9999"
+
+async def mark_loja_changed(loja_id: str, *lists: str, garantia_ate: Optional[str] = None):
+    """Record a committed write: bump the list versions, which also orphans cached dashboards.
+    Must run after the write, so a version is never paired with older data.
+    `garantia_ate` of a new sale pulls the store's next warranty boundary forward."""
+    if lists:
+        await db.loja_versions.update_one(
+            {"loja_id": loja_id},
+            {"$inc": {name: 1 for name in lists}, "$setOnInsert": {"epoch": str(uuid.uuid4())}},
+            upsert=True
+        )
+    if garantia_ate:
+        # Only lower a boundary that was already computed: a missing one is computed from
+        # every sale on the next list (older and imported sales included). After the
+        # version bump, so a concurrent recompute cannot store a boundary that misses it.
+        await db.loja_versions.update_one(
+            {"loja_id": loja_id, "garantia_proxima": {"$gt": garantia_ate}},
+            {"$set": {"garantia_proxima": garantia_ate}}
+        )
+
+async def next_garantia_boundary(loja_id: str, versions: dict) -> str:
+    """
+    Earliest garantia_ate still in the future for the store. Sale rows carry a
+    garantia_status that flips from "ativa" to "vencida" at that instant, so it is part of
+    the vendas ETag; it is looked up again (one query) only after it has passed.
+    """
+    now = datetime.now(timezone.utc).isoformat()
+    proxima = versions.get("garantia_proxima")
+    if proxima and proxima > now:
+        return proxima
+    venda = await db.vendas_concluidas.find_one(
+        {"loja_id": loja_id, "garantia_ate": {"$gt": now}},
+        {"_id": 0, "garantia_ate": 1},
+        sort=[("garantia_ate", 1)]
+    )
+    proxima = venda["garantia_ate"] if venda else GARANTIA_NENHUMA
+    # Only store it if no sale was written meanwhile; that sale's $min would be lost
+    await db.loja_versions.update_one(
+        {"loja_id": loja_id, "vendas": versions.get("vendas")},
+        {"$set": {"garantia_proxima": proxima}}
+    )
+    return proxima
+
+async def list_etag(loja_id: str, lista: str, request: Request) -> str:
+    """Strong ETag for a store list, derived from write counters and the query string."""
+    versions = await db.loja_versions.find_one({"loja_id": loja_id}, {"_id": 0}) or {}
+    parts = [loja_id, lista, versions.get("epoch", "")]
+    parts += [f"{name}={versions.get(name, 0)}" for name in LIST_VERSION_DEPENDENCIES[lista]]
+    if lista == "vendas":
+        parts.append(f"garantia={await next_garantia_boundary(loja_id, versions)}")
+    parts += sorted(f"{k}={v}" for k, v in request.query_params.multi_items())
+    return '"' + hashlib.sha1("|".join(parts).encode()).hexdigest() + '"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates or "*" in candidates
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+
 async def get_loja_by_slug(slug: str):
-    loja = await db.lojas.find_one({"slug": slug, "ativo": True}, {"_id": 0})
-    if not loja:
-        raise HTTPException(status_code=404, detail="Loja não encontrada")
-    return loja
+    loja = loja_cache.get(("slug", slug))
+    if loja is None:
+        loja = await db.lojas.find_one({"slug": slug, "ativo": True}, {"_id": 0})
+        if not loja:
+            raise HTTPException(status_code=404, detail="Loja não encontrada")
+        cache_loja(loja)
+    return dict(loja)
+
+async def get_loja_by_id(loja_id: str) -> Optional[dict]:
+    """Store by id, active or not; only active stores are cached."""
+    loja = loja_cache.get(("id", loja_id))
+    if loja is None:
+        loja = await db.lojas.find_one({"id": loja_id}, {"_id": 0})
+        if not loja:
+            return None
+        cache_loja(loja)
+    return dict(loja)
 
 async def verify_loja_access(slug: str, payload: dict):
     loja = await get_loja_by_slug(slug)
@@ -315,6 +750,450 @@ async def verify_loja_access(slug: str, payload: dict):
         raise HTTPException(status_code=403, detail="Acesso negado a esta loja")
     return loja
 
+async def get_lojas_stats(loja_ids: Optional[List[str]] = None) -> dict:
+    """Per-store totals (modelos, estoque, clientes, vendas) computed in a single aggregation.
+
+    Returns a dict keyed by loja_id. Stores without any documents are simply absent.
+    """
+    match = {"loja_id": {"$in": loja_ids}} if loja_ids is not None else {}
+
+    def branch(flag: str, extra: Optional[dict] = None, valor: bool = False) -> list:
+        projection = {"_id": 0, "loja_id": 1, flag: {"$literal": 1}}
+        if valor:
+            projection["valor"] = {"$ifNull": ["$valor_total", 0]}
+        return [{"$match": {**match, **(extra or {})}}, {"$project": projection}]
+
+    pipeline = [
+        *branch("modelo"),
+        {"$unionWith": {"coll": "produtos", "pipeline": branch("produto", {"vendido": False})}},
+        {"$unionWith": {"coll": "clientes", "pipeline": branch("cliente")}},
+        {"$unionWith": {"coll": "vendas_concluidas", "pipeline": branch("venda", valor=True)}},
+        {"$group": {
+            "_id": "$loja_id",
+            "total_modelos": {"$sum": "$modelo"},
+            "total_produtos": {"$sum": "$produto"},
+            "total_clientes": {"$sum": "$cliente"},
+            "total_vendas": {"$sum": "$venda"},
+            "valor_total_vendas": {"$sum": "$valor"},
+        }},
+    ]
+    stats = {}
+    async for row in db.modelos.aggregate(pipeline):
+        stats[row.pop("_id")] = row
+    return stats
+
+# Counters kept in loja_stats, one document per store
+LOJA_STATS_FIELDS = ("total_modelos", "total_produtos", "total_clientes", "total_vendas", "valor_total_vendas")
+
+def empty_loja_stats() -> dict:
+    return {field: 0 for field in LOJA_STATS_FIELDS}
+
+async def inc_loja_stats(loja_id: str, **deltas):
+    """Atomically apply counter deltas; call after the write they count is committed."""
+    deltas = {k: v for k, v in deltas.items() if v}
+    if deltas:
+        result = await db.loja_stats.update_one(
+            {"loja_id": loja_id},
+            {"$inc": deltas, "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}}
+        )
+        if result.matched_count == 0:
+            # Every store gets its document at creation or from the startup build, so it was
+            # removed since; rebuild it now; the aggregate already includes this write
+            await build_loja_stats([loja_id])
+
+async def build_loja_stats(loja_ids: List[str]) -> dict:
+    """
+    Compute the counters of stores without a loja_stats document and insert them.
+    $setOnInsert never clobbers a document created concurrently (and already receiving
+    $inc) by another build. Returns the computed counters keyed by loja_id.
+    """
+    computed = await get_lojas_stats(loja_ids)
+    now = datetime.now(timezone.utc).isoformat()
+    counters = {}
+    ops = []
+    for loja_id in loja_ids:
+        counters[loja_id] = {**empty_loja_stats(), **computed.get(loja_id, {})}
+        ops.append(UpdateOne(
+            {"loja_id": loja_id},
+            {"$setOnInsert": {**counters[loja_id], "updated_at": now}},
+            upsert=True
+        ))
+    if ops:
+        await db.loja_stats.bulk_write(ops, ordered=False)
+    return counters
+
+async def get_loja_counters(loja_ids: List[str]) -> dict:
+    """
+    Counters for the given stores keyed by loja_id. Documents are built at startup
+    (build_missing_loja_stats); one removed since is rebuilt here on its next read.
+    """
+    counters = {}
+    async for doc in db.loja_stats.find({"loja_id": {"$in": loja_ids}}, {"_id": 0}):
+        counters[doc["loja_id"]] = {field: doc.get(field, 0) for field in LOJA_STATS_FIELDS}
+    missing = [loja_id for loja_id in loja_ids if loja_id not in counters]
+    if missing:
+        counters.update(await build_loja_stats(missing))
+    return counters
+
+async def repair_loja_stats() -> List[dict]:
+    """
+    Rebuild every store's counters from scratch; returns the stores whose counters had drifted.
+    Writes landing between the aggregate and the $set are overwritten, so run it off-peak.
+    """
+    lojas = await db.lojas.find({}, {"_id": 0, "id": 1, "nome": 1}).to_list(None)
+    computed = await get_lojas_stats()
+    stored = {doc["loja_id"]: doc async for doc in db.loja_stats.find({}, {"_id": 0})}
+    now = datetime.now(timezone.utc).isoformat()
+    drift = []
+    ops = []
+    for loja in lojas:
+        expected = {**empty_loja_stats(), **computed.get(loja["id"], {})}
+        current = stored.get(loja["id"])
+        if current is not None:
+            diff = {
+                field: {"armazenado": current.get(field, 0), "real": expected[field]}
+                for field in LOJA_STATS_FIELDS
+                if abs((current.get(field) or 0) - expected[field]) > 0.005
+            }
+            if diff:
+                drift.append({"loja_id": loja["id"], "nome": loja.get("nome"), "diferencas": diff})
+        ops.append(UpdateOne({"loja_id": loja["id"]}, {"$set": {**expected, "updated_at": now}}, upsert=True))
+    if ops:
+        await db.loja_stats.bulk_write(ops, ordered=False)
+    return drift
+
+LOJA_STATS_BUILD_LOCK = "loja_stats"
+LOJA_STATS_BUILD_LOCK_TTL = 300
+
+async def build_missing_loja_stats() -> Optional[int]:
+    """
+    Build the loja_stats document of every store that has none (first deploy, stores from
+    an import or an older version). Returns how many were built, or None if another worker
+    holds the lock.
+
+    A write landing between the aggregate and the insert would be counted by neither, so
+    the build is fenced: startup_event awaits it, and every worker waits for the lock to
+    be released, before serving requests. No write path of this version runs meanwhile.
+    """
+    owner = await acquire_maintenance_lock(LOJA_STATS_BUILD_LOCK, LOJA_STATS_BUILD_LOCK_TTL)
+    if owner is None:
+        return None
+    try:
+        lojas = await db.lojas.find({}, {"_id": 0, "id": 1}).to_list(None)
+        built = {doc["loja_id"] async for doc in db.loja_stats.find({}, {"_id": 0, "loja_id": 1})}
+        missing = [loja["id"] for loja in lojas if loja["id"] not in built]
+        if missing:
+            await build_loja_stats(missing)
+        return len(missing)
+    finally:
+        await release_maintenance_lock(LOJA_STATS_BUILD_LOCK, owner)
+
+async def get_estoque_por_modelo(loja_id: str) -> dict:
+    """modelo_id -> number of unsold products, in one aggregation."""
+    pipeline = [
+        {"$match": {"loja_id": loja_id, "vendido": False}},
+        {"$group": {"_id": "$modelo_id", "quantidade": {"$sum": 1}}},
+    ]
+    return {row["_id"]: row["quantidade"] async for row in db.produtos.aggregate(pipeline)}
+
+async def get_modelo_nomes(modelo_ids) -> dict:
+    """Resolve modelo_id -> nome for a batch of ids with a single $in query."""
+    ids = list({m for m in modelo_ids if m})
+    if not ids:
+        return {}
+    modelos = await db.modelos.find({"id": {"$in": ids}}, {"_id": 0, "id": 1, "nome": 1}).to_list(len(ids))
+    return {m["id"]: m["nome"] for m in modelos}
+
+async def get_loja_nomes(loja_ids) -> dict:
+    """Resolve loja_id -> nome for a batch of ids with a single $in query."""
+    ids = list({l for l in loja_ids if l})
+    if not ids:
+        return {}
+    lojas = await db.lojas.find({"id": {"$in": ids}}, {"_id": 0, "id": 1, "nome": 1}).to_list(len(ids))
+    return {l["id"]: l["nome"] for l in lojas}
+
+async def get_cliente_nomes(cliente_ids) -> dict:
+    """Resolve cliente_id -> nome for a batch of ids with a single $in query."""
+    ids = list({c for c in cliente_ids if c})
+    if not ids:
+        return {}
+    clientes = await db.clientes.find({"id": {"$in": ids}}, {"_id": 0, "id": 1, "nome": 1}).to_list(len(ids))
+    return {c["id"]: c["nome"] for c in clientes}
+
+def parse_itens(itens) -> list:
+    """Sale items as a list of dicts; accepts native arrays and legacy JSON strings."""
+    if isinstance(itens, str):
+        try:
+            return json.loads(itens or "[]")
+        except ValueError:
+            return []
+    return itens or []
+
+def venda_response(venda: dict, cliente_nome: Optional[str], garantia_status: Optional[str] = None) -> "VendaConcluidaResponse":
+    itens = parse_itens(venda.get("itens"))
+    return VendaConcluidaResponse(
+        **{**venda, "itens": itens},
+        cliente_nome=cliente_nome,
+        itens_parsed=itens,
+        garantia_status=garantia_status
+    )
+
+transactions_supported = None
+
+async def supports_transactions() -> bool:
+    """Multi-document transactions need a replica set or mongos; checked once per process."""
+    global transactions_supported
+    if transactions_supported is None:
+        try:
+            hello = await client.admin.command("hello")
+            transactions_supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        except Exception as e:
+            logger.warning(f"Não foi possível detectar suporte a transações: {e}")
+            transactions_supported = False
+    return transactions_supported
+
+async def release_produtos(loja_id: str, venda_id: str):
+    """Undo a checkout reservation made for `venda_id`."""
+    await db.produtos.update_many(
+        {"loja_id": loja_id, "venda_id": venda_id},
+        {"$set": {"vendido": False}, "$unset": {"venda_id": ""}}
+    )
+
+def venda_row(venda: dict, cliente_nome: Optional[str], garantia_status: Optional[str] = None) -> dict:
+    """Trusted-row counterpart of venda_response for list endpoints."""
+    itens = [VENDA_ITEM_ROW(item) for item in parse_itens(venda.get("itens"))]
+    return VENDA_ROW(venda, itens=itens, itens_parsed=itens, cliente_nome=cliente_nome, garantia_status=garantia_status)
+
+def top_modelos_pipeline(match: dict, limit: int) -> list:
+    return [
+        {"$match": match},
+        {"$unwind": "$itens"},
+        {"$match": {"itens.modelo_id": {"$nin": [None, ""]}}},
+        {"$group": {
+            "_id": "$itens.modelo_id",
+            "nome": {"$first": "$itens.modelo_nome"},
+            "quantidade": {"$sum": 1},
+            "valor": {"$sum": {"$ifNull": ["$itens.preco", 0]}},
+        }},
+        {"$sort": {"quantidade": -1, "valor": -1}},
+        {"$limit": limit},
+    ]
+
+async def get_top_modelos(loja_id: str, mes: Optional[str] = None, limit: int = 10) -> List[dict]:
+    """
+    Best-selling models (quantity and revenue).
+    Month ("YYYY-MM") and year ("YYYY") filters, as well as the all-time ranking, read the
+    vendas_mensais rollups; finer prefixes (e.g. a single day) aggregate the sales themselves.
+    """
+    if mes and len(mes) > 7:
+        match = {"loja_id": loja_id, "itens": {"$type": "array"}, "data": {"$regex": f"^{re.escape(mes)}"}}
+        rows = db.vendas_concluidas.aggregate(top_modelos_pipeline(match, limit))
+    else:
+        match = {"loja_id": loja_id, "quantidade": {"$gt": 0}}
+        if mes:
+            match["mes"] = {"$regex": f"^{re.escape(mes)}"}
+        rows = db.vendas_mensais.aggregate([
+            {"$match": match},
+            {"$group": {
+                "_id": "$modelo_id",
+                "nome": {"$first": "$nome"},
+                "quantidade": {"$sum": "$quantidade"},
+                "valor": {"$sum": "$valor"},
+            }},
+            {"$sort": {"quantidade": -1, "valor": -1}},
+            {"$limit": limit},
+        ])
+    return [
+        {"modelo_id": row["_id"], "nome": row.get("nome") or "", "quantidade": row["quantidade"], "valor": row["valor"]}
+        async for row in rows
+    ]
+
+def rollup_ops(vendas: list, sign: int = 1) -> list:
+    """
+    vendas_mensais updates for some sales; sign=-1 reverses previously counted sales.
+    Always upserts: a reversal may reach a row before the backfill's $inc for the same
+    sale (see backfill_vendas_mensais), and the two must still add up.
+    """
+    totals = {}
+    for venda in vendas:
+        mes = str(venda.get("data", ""))[:7]
+        for item in parse_itens(venda.get("itens")):
+            modelo_id = item.get("modelo_id")
+            if not modelo_id:
+                continue
+            total = totals.setdefault(
+                (venda["loja_id"], mes, modelo_id),
+                {"nome": item.get("modelo_nome") or "", "quantidade": 0, "valor": 0}
+            )
+            total["quantidade"] += 1
+            total["valor"] += item.get("preco") or 0
+    return [
+        UpdateOne(
+            {"loja_id": loja_id, "mes": mes, "modelo_id": modelo_id},
+            {"$inc": {"quantidade": sign * total["quantidade"], "valor": sign * total["valor"]},
+             "$setOnInsert": {"nome": total["nome"]}},
+            upsert=True
+        )
+        for (loja_id, mes, modelo_id), total in totals.items()
+    ]
+
+async def apply_rollup(ops: list):
+    if ops:
+        await db.vendas_mensais.bulk_write(ops, ordered=False)
+
+ROLLUP_BACKFILL_LOCK = "vendas_mensais"
+ROLLUP_BACKFILL_LOCK_TTL = 600
+ROLLUP_BACKFILL_BATCH = 200
+
+async def acquire_maintenance_lock(name: str, ttl: float) -> Optional[str]:
+    """
+    Take a cluster-wide lock in `maintenance_locks`; an expired lock can be taken over.
+    Returns the owner token to release it with, or None if someone else holds it.
+    """
+    now = datetime.now(timezone.utc)
+    owner = str(uuid.uuid4())
+    try:
+        await db.maintenance_locks.update_one(
+            {"_id": name, "expires_at": {"$lt": now}},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=ttl)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return None
+    return owner
+
+async def release_maintenance_lock(name: str, owner: str):
+    """Release only if still ours; an expired lock may have been taken over meanwhile."""
+    await db.maintenance_locks.delete_one({"_id": name, "owner": owner})
+
+async def backfill_vendas_mensais(loja_id: Optional[str] = None) -> Optional[int]:
+    """
+    Fold sales not yet counted in the monthly rollups into them (one store or all).
+    Returns how many sales were counted, or None if another backfill holds the lock.
+
+    Sales written by this API are stored with `rollup: True` and counted by their own
+    writer, so only history from before the rollups is left. Writers are never blocked:
+    each sale is claimed with a conditional find_one_and_update that sets `rollup` to a
+    batch token, the claimed batch is counted with $inc, then marked True. delete_venda
+    reverses any sale whose deleted document has `rollup` set, so a delete racing the
+    backfill nets out whichever side wins. A crash between claim and $inc leaves that
+    batch uncounted (its sales keep the token).
+    """
+    owner = await acquire_maintenance_lock(ROLLUP_BACKFILL_LOCK, ROLLUP_BACKFILL_LOCK_TTL)
+    if owner is None:
+        return None
+    try:
+        scope = {"loja_id": loja_id} if loja_id else {}
+        counted = 0
+        ids = []
+        async for venda in db.vendas_concluidas.find({**scope, "rollup": {"$exists": False}}, {"_id": 1}):
+            ids.append(venda["_id"])
+            if len(ids) >= ROLLUP_BACKFILL_BATCH:
+                counted += await count_rollup_batch(ids)
+                ids = []
+        if ids:
+            counted += await count_rollup_batch(ids)
+        if not loja_id:
+            await db.migrations.update_one(
+                {"_id": ROLLUP_BACKFILL_LOCK},
+                {"$set": {"completed_at": datetime.now(timezone.utc).isoformat()}},
+                upsert=True
+            )
+        return counted
+    finally:
+        await release_maintenance_lock(ROLLUP_BACKFILL_LOCK, owner)
+
+async def count_rollup_batch(ids: list) -> int:
+    """Claim each sale atomically (it may be deleted concurrently), then count the claimed ones."""
+    token = str(uuid.uuid4())
+    claims = await asyncio.gather(*(
+        db.vendas_concluidas.find_one_and_update(
+            {"_id": _id, "rollup": {"$exists": False}},
+            {"$set": {"rollup": token}},
+            projection={"_id": 0, "loja_id": 1, "data": 1, "itens": 1}
+        )
+        for _id in ids
+    ))
+    vendas = [venda for venda in claims if venda is not None]
+    await apply_rollup(rollup_ops(vendas))
+    await db.vendas_concluidas.update_many({"_id": {"$in": ids}, "rollup": token}, {"$set": {"rollup": True}})
+    return len(vendas)
+
+async def migrate_vendas_itens(batch_size: int = 1000) -> int:
+    """
+    Convert legacy JSON-string `itens` into embedded arrays. Idempotent; returns converted count.
+    Strings that don't decode to a list are left untouched (and logged) rather than replaced
+    by an empty array, so the sale lines are never lost; they keep counting as `remaining`.
+    """
+    converted = 0
+    ops = []
+    undecodable = []
+    async for venda in db.vendas_concluidas.find({"itens": {"$type": "string"}}, {"_id": 1, "id": 1, "itens": 1}):
+        try:
+            itens = json.loads(venda["itens"]) if venda["itens"].strip() else []
+        except ValueError:
+            itens = None
+        if not isinstance(itens, list):
+            undecodable.append(venda.get("id") or str(venda["_id"]))
+            continue
+        ops.append(UpdateOne(
+            {"_id": venda["_id"], "itens": venda["itens"]},
+            {"$set": {"itens": itens}}
+        ))
+        if len(ops) >= batch_size:
+            result = await db.vendas_concluidas.bulk_write(ops, ordered=False)
+            converted += result.modified_count
+            ops = []
+    if ops:
+        result = await db.vendas_concluidas.bulk_write(ops, ordered=False)
+        converted += result.modified_count
+    if undecodable:
+        logger.warning(
+            f"Migração de itens: {len(undecodable)} vendas com itens ilegíveis mantidas como texto: "
+            f"{', '.join(undecodable[:20])}"
+        )
+    return converted
+
+def encode_cursor(data: str, doc_id: str) -> str:
+    raw = json.dumps([data, doc_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data, doc_id = json.loads(raw)
+        return str(data), str(doc_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def to_utc_iso(value: datetime) -> str:
+    """ISO string comparable with the stored `data` fields (UTC, +00:00)."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+def is_password_hash(senha: str) -> bool:
+    return senha.startswith(("$2a$", "$2b$", "$2y$"))
+
+def password_needs_rehash(senha: str) -> bool:
+    """Plaintext (legacy) or hashed with a different cost than BCRYPT_ROUNDS."""
+    return not is_password_hash(senha) or senha[4:6] != f"{BCRYPT_ROUNDS:02d}"
+
+async def hash_password(senha: str) -> str:
+    loop = asyncio.get_running_loop()
+    hashed = await loop.run_in_executor(password_executor, bcrypt.hashpw, senha.encode(), bcrypt.gensalt(BCRYPT_ROUNDS))
+    return hashed.decode()
+
+async def verify_password(senha: str, stored: str) -> bool:
+    if not is_password_hash(stored):
+        return hmac.compare_digest(senha.encode(), stored.encode())
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, bcrypt.checkpw, senha.encode(), stored.encode())
+
+async def rehash_password(user_id: str, old: str, senha: str):
+    # Conditional on the old value so a password changed meanwhile is not overwritten
+    await db.usuarios.update_one({"id": user_id, "senha": old}, {"$set": {"senha": await hash_password(senha)}})
+
 def validate_cpf(cpf: str) -> bool:
     cpf_clean = re.sub(r'\D', '', cpf)
     return len(cpf_clean) == 11
@@ -336,15 +1215,18 @@ async def login(request: LoginRequest):
     user = await db.usuarios.find_one({"email": request.email, "ativo": True}, {"_id": 0})
     if not user:
         raise HTTPException(status_code=404, detail="Usuário não encontrado.")
-    if user["senha"] != request.senha:
+    if not await verify_password(request.senha, user["senha"]):
         raise HTTPException(status_code=401, detail="Senha incorreta.")
+    if password_needs_rehash(user["senha"]):
+        spawn_background(rehash_password(user["id"], user["senha"], request.senha))
     
     loja_slug = None
     if user.get("loja_id"):
-        loja = await db.lojas.find_one({"id": user["loja_id"]}, {"_id": 0})
+        loja = await get_loja_by_id(user["loja_id"])
         if loja:
             loja_slug = loja["slug"]
     
+    revocation_cache.set(user["id"], user.get("revoked_at", 0.0))
     token = create_token(user["id"], user["email"], user["role"], user.get("loja_id"))
     return LoginResponse(
         token=token, 
@@ -364,7 +1246,7 @@ async def get_current_user(payload: dict = Depends(verify_token)):
     
     loja_slug = None
     if user.get("loja_id"):
-        loja = await db.lojas.find_one({"id": user["loja_id"]}, {"_id": 0})
+        loja = await get_loja_by_id(user["loja_id"])
         if loja:
             loja_slug = loja["slug"]
     
@@ -379,30 +1261,12 @@ async def admin_dashboard(payload: dict = Depends(require_super_admin)):
     lojas_ativas = len([l for l in lojas if l.get("ativo", True)])
     total_usuarios = await db.usuarios.count_documents({})
     
-    # Calculate global stats
-    vendas = await db.vendas_concluidas.find({}, {"_id": 0}).to_list(10000)
-    total_vendas_global = len(vendas)
-    valor_total_global = sum(v.get("valor_total", 0) for v in vendas)
+    # Stats per store (maintained counters, one read)
+    stats = await get_loja_counters([loja["id"] for loja in lojas])
+    total_vendas_global = sum(s["total_vendas"] for s in stats.values())
+    valor_total_global = sum(s["valor_total_vendas"] for s in stats.values())
     
-    # Stats per store
-    lojas_with_stats = []
-    for loja in lojas:
-        loja_id = loja["id"]
-        total_modelos = await db.modelos.count_documents({"loja_id": loja_id})
-        total_produtos = await db.produtos.count_documents({"loja_id": loja_id, "vendido": False})
-        total_clientes = await db.clientes.count_documents({"loja_id": loja_id})
-        loja_vendas = [v for v in vendas if v.get("loja_id") == loja_id]
-        total_vendas = len(loja_vendas)
-        valor_total = sum(v.get("valor_total", 0) for v in loja_vendas)
-        
-        lojas_with_stats.append(LojaWithStats(
-            **loja,
-            total_modelos=total_modelos,
-            total_produtos=total_produtos,
-            total_clientes=total_clientes,
-            total_vendas=total_vendas,
-            valor_total_vendas=valor_total
-        ))
+    lojas_with_stats = [LojaWithStats(**loja, **stats[loja["id"]]) for loja in lojas]
     
     return AdminDashboardStats(
         total_lojas=total_lojas,
@@ -416,25 +1280,8 @@ async def admin_dashboard(payload: dict = Depends(require_super_admin)):
 @admin_router.get("/lojas", response_model=List[LojaWithStats])
 async def list_lojas(payload: dict = Depends(require_super_admin)):
     lojas = await db.lojas.find({}, {"_id": 0}).to_list(1000)
-    vendas = await db.vendas_concluidas.find({}, {"_id": 0}).to_list(10000)
-    
-    result = []
-    for loja in lojas:
-        loja_id = loja["id"]
-        total_modelos = await db.modelos.count_documents({"loja_id": loja_id})
-        total_produtos = await db.produtos.count_documents({"loja_id": loja_id, "vendido": False})
-        total_clientes = await db.clientes.count_documents({"loja_id": loja_id})
-        loja_vendas = [v for v in vendas if v.get("loja_id") == loja_id]
-        
-        result.append(LojaWithStats(
-            **loja,
-            total_modelos=total_modelos,
-            total_produtos=total_produtos,
-            total_clientes=total_clientes,
-            total_vendas=len(loja_vendas),
-            valor_total_vendas=sum(v.get("valor_total", 0) for v in loja_vendas)
-        ))
-    return result
+    stats = await get_loja_counters([loja["id"] for loja in lojas])
+    return [LojaWithStats(**loja, **stats[loja["id"]]) for loja in lojas]
 
 @admin_router.post("/lojas", response_model=Loja)
 async def create_loja(loja: LojaCreate, payload: dict = Depends(require_super_admin)):
@@ -448,6 +1295,11 @@ async def create_loja(loja: LojaCreate, payload: dict = Depends(require_super_ad
     doc = loja_obj.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
     await db.lojas.insert_one(doc)
+    await db.loja_stats.update_one(
+        {"loja_id": loja_obj.id},
+        {"$setOnInsert": {**empty_loja_stats(), "updated_at": doc['created_at']}},
+        upsert=True
+    )
     return loja_obj
 
 @admin_router.get("/lojas/{loja_id}", response_model=LojaWithStats)
@@ -456,19 +1308,8 @@ async def get_loja(loja_id: str, payload: dict = Depends(require_super_admin)):
     if not loja:
         raise HTTPException(status_code=404, detail="Loja não encontrada")
     
-    total_modelos = await db.modelos.count_documents({"loja_id": loja_id})
-    total_produtos = await db.produtos.count_documents({"loja_id": loja_id, "vendido": False})
-    total_clientes = await db.clientes.count_documents({"loja_id": loja_id})
-    vendas = await db.vendas_concluidas.find({"loja_id": loja_id}, {"_id": 0}).to_list(10000)
-    
-    return LojaWithStats(
-        **loja,
-        total_modelos=total_modelos,
-        total_produtos=total_produtos,
-        total_clientes=total_clientes,
-        total_vendas=len(vendas),
-        valor_total_vendas=sum(v.get("valor_total", 0) for v in vendas)
-    )
+    stats = await get_loja_counters([loja_id])
+    return LojaWithStats(**loja, **stats[loja_id])
 
 @admin_router.put("/lojas/{loja_id}", response_model=Loja)
 async def update_loja(loja_id: str, loja: LojaUpdate, payload: dict = Depends(require_super_admin)):
@@ -481,8 +1322,26 @@ async def update_loja(loja_id: str, loja: LojaUpdate, payload: dict = Depends(re
         raise HTTPException(status_code=404, detail="Loja não encontrada")
     
     updated = await db.lojas.find_one({"id": loja_id}, {"_id": 0})
+    # Name/logo changes and deactivation must be visible immediately
+    invalidate_loja(loja_id, updated["slug"])
     return Loja(**updated)
 
+@admin_router.post("/loja-stats/repair")
+async def repair_stats(payload: dict = Depends(require_super_admin)):
+    """Recompute all store counters from the source collections and report any drift."""
+    drift = await repair_loja_stats()
+    await invalidate_dashboard()
+    if drift:
+        logger.warning(f"Contadores de lojas divergentes corrigidos: {[d['loja_id'] for d in drift]}")
+    return {"repaired": True, "lojas_com_divergencia": len(drift), "divergencias": drift}
+
+@admin_router.get("/cache")
+async def cache_stats(payload: dict = Depends(require_super_admin)):
+    return {
+        "lojas": loja_cache.stats(), "dashboard": dashboard_cache.stats(),
+        "tokens": token_cache.stats(), "revocations": revocation_cache.stats()
+    }
+
 # ============== DATA IMPORT ==============
 
 class ImportResult(BaseModel):
@@ -492,7 +1351,524 @@ class ImportResult(BaseModel):
     errors: List[str]
     details: dict
 
-@admin_router.post("/import/{loja_id}")
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_MAX_ERRORS = 20
+IMPORT_SAMPLE_SIZE = 10
+
+FORMA_PAGAMENTO_MAP = {
+    'pix': 'pix', 'dinheiro': 'dinheiro', 'cartão': 'cartao_credito',
+    'cartao': 'cartao_credito', 'credito': 'cartao_credito', 'débito': 'cartao_debito',
+    'debito': 'cartao_debito', 'transferencia': 'transferencia', 'outra': 'dinheiro'
+}
+
+def detect_import_type(record: dict) -> Optional[str]:
+    """Guess the data type of an import from the keys of its first record."""
+    keys = set(record.keys())
+    if 'imei' in keys or ('modelo_id' in keys and 'cor' in keys):
+        return 'produtos'
+    if 'cpf' in keys or 'whatsapp' in keys or 'telefone' in keys:
+        return 'clientes'
+    if ('nome' in keys and len(keys) <= 3) or (keys == {'id', 'nome'}):
+        return 'modelos'
+    if 'valor_total' in keys or 'forma_pagamento' in keys or 'cliente_id' in keys:
+        return 'vendas'
+    return None
+
+def parse_import_valor(value) -> float:
+    try:
+        return float(str(value).replace('R$', '').replace(',', '.').strip())
+    except (TypeError, ValueError):
+        return 0.0
+
+def parse_import_data(value) -> datetime:
+    """Parse a sale date from an import row; supports database ISO exports and BR formats."""
+    if not value:
+        return datetime.now(timezone.utc)
+    data_str = str(value).strip()
+    try:
+        # Try ISO format first (from database export)
+        if 'T' in data_str or '+' in data_str or len(data_str) > 10:
+            # ISO format: 2025-07-09 13:42:14.925264+00 or 2025-07-09T13:42:14
+            data_str = data_str.split('+')[0].split('.')[0].replace('T', ' ')
+            try:
+                return datetime.strptime(data_str, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+            except ValueError:
+                return datetime.strptime(data_str.split(' ')[0], '%Y-%m-%d').replace(tzinfo=timezone.utc)
+        for fmt in ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y']:
+            try:
+                return datetime.strptime(data_str, fmt).replace(tzinfo=timezone.utc)
+            except ValueError:
+                continue
+    except ValueError:
+        pass
+    return datetime.now(timezone.utc)
+
+def parse_import_itens(itens_raw, valor_total: float, resolve_modelo: Optional[Callable[[str, str], Optional[str]]] = None) -> list:
+    """
+    Parse sale items from a JSON string export; falls back to one generic item.
+    `resolve_modelo(old_id, nome)` maps an item's model to this store's modelo_id, so the
+    imported sale is counted in the monthly rollups and the top-selling models.
+    """
+    itens = []
+    if isinstance(itens_raw, str) and itens_raw.strip():
+        try:
+            # Clean up escaped JSON
+            clean_json = itens_raw.strip().strip('"').replace('\\"', '"').replace('\\\\', '\\')
+            for item in json.loads(clean_json):
+                modelo_info = item.get('modelo', {})
+                modelo_nome = modelo_info.get('nome', item.get('modelo_nome', 'Produto'))
+                old_modelo_id = str(item.get('modelo_id', modelo_info.get('id', ''))).strip()
+                itens.append({
+                    "produto_id": str(item.get('id', uuid.uuid4())),
+                    "modelo_id": resolve_modelo(old_modelo_id, modelo_nome) if resolve_modelo else None,
+                    "modelo_nome": modelo_nome,
+                    "cor": item.get('cor', ''),
+                    "memoria": str(item.get('memoria', '')),
+                    "preco": float(item.get('preco', 0))
+                })
+        except Exception:
+            itens = []
+    if not itens:
+        itens = [{
+            "produto_id": str(uuid.uuid4()),
+            "modelo_nome": "Produto Importado",
+            "cor": "",
+            "memoria": "",
+            "preco": valor_total
+        }]
+    return itens
+
+class BulkImporter:
+    """
+    Import engine for one store and data type.
+    Duplicate checks run against per-store lookup maps loaded once up front, and
+    valid rows are written through chunked, unordered insert_many calls.
+    """
+
+    COLLECTIONS = {
+        "modelos": "modelos",
+        "clientes": "clientes",
+        "produtos": "produtos",
+        "vendas": "vendas_concluidas",
+    }
+
+    def __init__(self, loja_id: str, data_type: str):
+        if data_type not in self.COLLECTIONS:
+            raise HTTPException(status_code=400, detail=f"Tipo de dados '{data_type}' não suportado para importação")
+        self.loja_id = loja_id
+        self.data_type = data_type
+        self.collection = db[self.COLLECTIONS[data_type]]
+        self.processed = 0
+        self.imported = 0
+        self.skipped = 0
+        self.error_count = 0
+        self.errors = []
+        self.sample_created = []
+        self.sample_skipped = []
+        self._pending = []  # (line, doc, label)
+
+    async def load(self):
+        """Preload ID mappings and the lookup maps used for duplicate detection."""
+        loja_id = self.loja_id
+        # Existing ID mappings for this store (stored in a special collection)
+        id_map_doc = await db.import_id_mappings.find_one({"loja_id": loja_id}) or {}
+        self.modelos_id_map = id_map_doc.get("modelos", {})
+        self.clientes_id_map = id_map_doc.get("clientes", {})
+        self.produtos_id_map = id_map_doc.get("produtos", {})
+
+        if self.data_type in ("modelos", "produtos", "vendas"):
+            modelos = await db.modelos.find({"loja_id": loja_id}, {"_id": 0, "id": 1, "nome": 1}).to_list(None)
+            self.modelos_by_name = {m["nome"].lower(): m["id"] for m in modelos}
+            self.modelo_nomes = {m["id"]: m["nome"] for m in modelos}
+        if self.data_type in ("clientes", "vendas"):
+            clientes = await db.clientes.find({"loja_id": loja_id}, {"_id": 0, "id": 1, "nome": 1, "cpf": 1}).to_list(None)
+            self.clientes_by_cpf = {c["cpf"]: c["id"] for c in clientes if c.get("cpf")}
+            self.clientes_by_name = {c["nome"].lower(): c["id"] for c in clientes}
+            self.cliente_nomes = {c["id"]: c["nome"] for c in clientes}
+        if self.data_type == "produtos":
+            produtos = await db.produtos.find(
+                {"loja_id": loja_id, "imei": {"$nin": [None, ""]}}, {"_id": 0, "id": 1, "imei": 1}
+            ).to_list(None)
+            self.produtos_by_imei = {p["imei"]: p["id"] for p in produtos}
+
+    def _error(self, line: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append(f"Linha {line}: {message}")
+
+    def _skip(self, label: str):
+        self.skipped += 1
+        if len(self.sample_skipped) < IMPORT_SAMPLE_SIZE:
+            self.sample_skipped.append(label)
+
+    async def add(self, line: int, record: dict):
+        """Validate one row and queue it for insertion."""
+        self.processed += 1
+        try:
+            row = getattr(self, f"_row_{self.data_type}")(line, record)
+        except Exception as e:
+            self._error(line, str(e))
+            return
+        if row:
+            self._pending.append((line, *row))
+            if len(self._pending) >= IMPORT_CHUNK_SIZE:
+                await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        failed = {}
+        try:
+            await self.collection.insert_many([doc for _, doc, _ in batch], ordered=False)
+        except BulkWriteError as e:
+            failed = {err["index"]: err.get("errmsg", "erro de escrita") for err in e.details.get("writeErrors", [])}
+        except Exception as e:
+            failed = {index: str(e) for index in range(len(batch))}
+        inserted = []
+        for index, (line, doc, label) in enumerate(batch):
+            if index in failed:
+                self._error(line, failed[index])
+                continue
+            inserted.append(doc)
+            self.imported += 1
+            if len(self.sample_created) < IMPORT_SAMPLE_SIZE:
+                self.sample_created.append(label)
+        await inc_loja_stats(self.loja_id, **self._stats_deltas(inserted))
+        if self.data_type == "vendas":
+            await apply_rollup(rollup_ops(inserted))
+        await mark_loja_changed(self.loja_id, self.data_type)
+
+    def _stats_deltas(self, docs: list) -> dict:
+        if self.data_type == "modelos":
+            return {"total_modelos": len(docs)}
+        if self.data_type == "clientes":
+            return {"total_clientes": len(docs)}
+        if self.data_type == "produtos":
+            return {"total_produtos": len([d for d in docs if not d["vendido"]])}
+        return {"total_vendas": len(docs), "valor_total_vendas": sum(d["valor_total"] for d in docs)}
+
+    async def finish(self) -> "ImportResult":
+        await self.flush()
+        # Save ID mappings for future imports
+        await db.import_id_mappings.update_one(
+            {"loja_id": self.loja_id},
+            {"$set": {
+                "loja_id": self.loja_id,
+                "modelos": self.modelos_id_map,
+                "clientes": self.clientes_id_map,
+                "produtos": self.produtos_id_map
+            }},
+            upsert=True
+        )
+        return ImportResult(
+            success=self.error_count == 0,
+            total_records=self.processed,
+            imported=self.imported,
+            errors=self.errors,
+            details={
+                "created_count": self.imported,
+                "skipped_count": self.skipped,
+                "error_count": self.error_count,
+                "sample_created": self.sample_created,
+                "sample_skipped": self.sample_skipped
+            }
+        )
+
+    def _row_modelos(self, line: int, record: dict):
+        old_id = str(record.get('id', '')).strip()
+        nome = record.get('nome', '').strip()
+        marca = record.get('marca', '').strip()
+
+        if not nome:
+            self._error(line, "Nome do modelo é obrigatório")
+            return None
+
+        # Model already exists by name (case-insensitive): map old ID to existing UUID
+        existing_id = self.modelos_by_name.get(nome.lower())
+        if existing_id:
+            if old_id:
+                self.modelos_id_map[old_id] = existing_id
+            self._skip(nome)
+            return None
+
+        new_id = str(uuid.uuid4())
+        self.modelos_by_name[nome.lower()] = new_id
+        if old_id:
+            self.modelos_id_map[old_id] = new_id
+        return {
+            "id": new_id,
+            "nome": nome,
+            "marca": marca,
+            "loja_id": self.loja_id,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }, nome
+
+    def _row_clientes(self, line: int, record: dict):
+        old_id = str(record.get('id', '')).strip()
+        nome = record.get('nome', '').strip()
+        cpf = record.get('cpf', '').strip()
+        whatsapp = record.get('whatsapp', record.get('telefone', '')).strip()
+        email = record.get('email', '').strip()
+        endereco = record.get('endereco', '').strip()
+
+        if not nome:
+            self._error(line, "Nome do cliente é obrigatório")
+            return None
+
+        # Client already exists by CPF or name
+        existing_id = (cpf and self.clientes_by_cpf.get(cpf)) or self.clientes_by_name.get(nome.lower())
+        if existing_id:
+            if old_id:
+                self.clientes_id_map[old_id] = existing_id
+            self._skip(nome)
+            return None
+
+        new_id = str(uuid.uuid4())
+        if cpf:
+            self.clientes_by_cpf[cpf] = new_id
+        self.clientes_by_name[nome.lower()] = new_id
+        self.cliente_nomes[new_id] = nome
+        if old_id:
+            self.clientes_id_map[old_id] = new_id
+        return {
+            "id": new_id,
+            "nome": nome,
+            "cpf": cpf,
+            "whatsapp": whatsapp,
+            "email": email,
+            "endereco": endereco,
+            "loja_id": self.loja_id,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }, nome
+
+    def _row_produtos(self, line: int, record: dict):
+        old_id = str(record.get('id', '')).strip()
+        old_modelo_id = str(record.get('modelo_id', '')).strip()
+        modelo_nome = record.get('modelo', record.get('modelo_nome', '')).strip()
+        cor = record.get('cor', '').strip()
+        memoria = record.get('memoria', '').strip()
+        bateria = str(record.get('bateria', record.get('saude_bateria', ''))).strip()
+        imei = record.get('imei', '').strip()
+        vendido = str(record.get('vendido', 'false')).lower() in ['true', '1', 'yes', 'sim']
+
+        # modelo_id from old ID mapping, then by name
+        modelo_id = self.modelos_id_map.get(old_modelo_id) if old_modelo_id else None
+        if not modelo_id and modelo_nome:
+            modelo_id = self.modelos_by_name.get(modelo_nome.lower())
+
+        # Model must be imported first
+        if not modelo_id:
+            if old_modelo_id:
+                self._error(line, f"Modelo ID {old_modelo_id} não encontrado. Importe modelos primeiro.")
+            else:
+                self._error(line, "Modelo é obrigatório")
+            return None
+
+        # Product with same IMEI exists
+        if imei:
+            existing_id = self.produtos_by_imei.get(imei)
+            if existing_id:
+                if old_id:
+                    self.produtos_id_map[old_id] = existing_id
+                self._skip(f"IMEI {imei}")
+                return None
+
+        # Produto.bateria is an int (percent); keep it typed so every read path agrees
+        try:
+            bateria = int(float(bateria.rstrip('%'))) if bateria else None
+        except ValueError:
+            bateria = None
+
+        new_id = str(uuid.uuid4())
+        if imei:
+            self.produtos_by_imei[imei] = new_id
+        if old_id:
+            self.produtos_id_map[old_id] = new_id
+        display_name = self.modelo_nomes.get(modelo_id, "?")
+        return {
+            "id": new_id,
+            "modelo_id": modelo_id,
+            "cor": cor,
+            "memoria": memoria,
+            "bateria": bateria,
+            "imei": imei,
+            "preco": parse_import_valor(record.get('preco', record.get('valor', 0))),
+            "vendido": vendido,
+            "loja_id": self.loja_id,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }, f"{display_name} ({cor})"
+
+    def _resolve_modelo(self, old_id: str, nome: str) -> Optional[str]:
+        """Imported sale item -> modelo_id, by old-ID mapping first, then by name."""
+        return (old_id and self.modelos_id_map.get(old_id)) or self.modelos_by_name.get(str(nome).lower())
+
+    def _row_vendas(self, line: int, record: dict):
+        old_cliente_id = str(record.get('cliente_id', '')).strip()
+        cliente_cpf = record.get('cliente_cpf', record.get('cpf', '')).strip()
+        cliente_nome = record.get('cliente_nome', record.get('cliente', '')).strip()
+
+        # cliente_id from old ID mapping, then by CPF, then by name
+        cliente_id = self.clientes_id_map.get(old_cliente_id) if old_cliente_id else None
+        if not cliente_id and cliente_cpf:
+            cliente_id = self.clientes_by_cpf.get(cliente_cpf)
+        if not cliente_id and cliente_nome:
+            cliente_id = self.clientes_by_name.get(cliente_nome.lower())
+
+        if not cliente_id and old_cliente_id:
+            self._error(line, f"Cliente ID {old_cliente_id} não encontrado. Importe clientes primeiro.")
+            return None
+        if not cliente_id:
+            self._error(line, "Cliente não identificado")
+            return None
+
+        valor_total = parse_import_valor(record.get('valor_total', record.get('total', 0)))
+        data_venda = parse_import_data(record.get('data', record.get('data_venda', '')))
+        forma_pagamento = record.get('forma_pagamento', record.get('pagamento', 'dinheiro')).strip()
+        forma_pagamento = FORMA_PAGAMENTO_MAP.get(forma_pagamento.lower(), 'dinheiro')
+        observacao = record.get('observacao', record.get('obs', '')).strip()
+        itens = parse_import_itens(record.get('itens', '[]'), valor_total, self._resolve_modelo)
+
+        cliente_display = self.cliente_nomes.get(cliente_id, "?")
+        return {
+            "id": str(uuid.uuid4()),
+            "cliente_id": cliente_id,
+            "itens": itens,
+            "valor_total": valor_total,
+            "forma_pagamento": forma_pagamento,
+            "observacao": observacao,
+            "data": data_venda.isoformat(),
+            "loja_id": self.loja_id,
+            "rollup": True  # counted by flush(), not by the backfill
+        }, f"R$ {valor_total:.2f} - {cliente_display}"
+
+IMPORT_READ_CHUNK = 1024 * 1024
+IMPORT_SPOOL_DIR = os.environ.get('IMPORT_SPOOL_DIR') or None
+# A queued/running job whose progress has not moved for this long is considered orphaned
+IMPORT_JOB_STALE_SECONDS = float(os.environ.get('IMPORT_JOB_STALE_SECONDS', '600'))
+
+
+class ImportJob(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    loja_id: str
+    data_type: str
+    filename: str
+    status: str  # queued, running, done, failed
+    processed: int = 0
+    imported: int = 0
+    skipped: int = 0
+    error_count: int = 0
+    result: Optional[ImportResult] = None
+    error: Optional[str] = None
+    created_at: str
+    updated_at: str
+
+def iter_csv_records(path: str):
+    with open(path, newline='', encoding='utf-8') as f:
+        yield from csv.DictReader(f)
+
+def iter_json_records(path: str):
+    """Incrementally yield the items of a top-level JSON array (or a single object)."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        buf = f.read(IMPORT_READ_CHUNK).lstrip()
+        if not buf:
+            return
+        if buf[0] != '[':
+            # Single object: small by definition, parse it whole
+            yield json.loads(buf + f.read())
+            return
+        pos = 1
+        eof = False
+        while True:
+            while pos < len(buf) and (buf[pos].isspace() or buf[pos] == ','):
+                pos += 1
+            if pos < len(buf) and buf[pos] == ']':
+                return
+            try:
+                if pos >= len(buf):
+                    raise json.JSONDecodeError("Fim inesperado", buf, pos)
+                record, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(IMPORT_READ_CHUNK)
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+            yield record
+
+async def next_records(records, size: int) -> list:
+    """Read and parse up to `size` records in a worker thread (file I/O and JSON/CSV parsing stay off the loop)."""
+    return await asyncio.to_thread(lambda: list(itertools.islice(records, size)))
+
+def discard_upload(records, path: str):
+    records.close()
+    os.unlink(path)
+
+async def spool_upload(file: UploadFile, suffix: str) -> str:
+    """Copy an upload to a temporary file on disk in fixed-size chunks."""
+    fd, path = tempfile.mkstemp(prefix="import-", suffix=suffix, dir=IMPORT_SPOOL_DIR)
+    os.close(fd)
+    async with aiofiles.open(path, 'wb') as out:
+        while True:
+            chunk = await file.read(IMPORT_READ_CHUNK)
+            if not chunk:
+                break
+            await out.write(chunk)
+    return path
+
+async def update_import_job(job_id: str, **fields):
+    fields["updated_at"] = datetime.now(timezone.utc).isoformat()
+    await db.import_jobs.update_one({"id": job_id}, {"$set": fields})
+
+async def run_import_job(job_id: str, loja_id: str, data_type: str, first: dict, records, path: str):
+    importer = BulkImporter(loja_id, data_type)
+    try:
+        await update_import_job(job_id, status="running")
+        await importer.load()
+        batch = [first] + await next_records(records, IMPORT_CHUNK_SIZE - 1)
+        line = 0
+        while batch:
+            for record in batch:
+                line += 1
+                await importer.add(line, record)
+            await update_import_job(
+                job_id,
+                processed=importer.processed,
+                imported=importer.imported,
+                skipped=importer.skipped,
+                error_count=importer.error_count
+            )
+            batch = await next_records(records, IMPORT_CHUNK_SIZE)
+        result = await importer.finish()
+        await update_import_job(
+            job_id,
+            status="done",
+            processed=importer.processed,
+            imported=importer.imported,
+            skipped=importer.skipped,
+            error_count=importer.error_count,
+            result=result.model_dump()
+        )
+    except Exception as e:
+        logger.error(f"Importação {job_id} falhou: {e}", exc_info=True)
+        error = "Arquivo JSON inválido" if isinstance(e, json.JSONDecodeError) else f"Erro ao importar: {str(e)}"
+        await update_import_job(
+            job_id,
+            status="failed",
+            processed=importer.processed,
+            imported=importer.imported,
+            skipped=importer.skipped,
+            error_count=importer.error_count,
+            error=error
+        )
+    finally:
+        discard_upload(records, path)
+
+@admin_router.post("/import/{loja_id}", status_code=202)
 async def import_data(
     loja_id: str, 
     file: UploadFile = File(...),
@@ -500,423 +1876,105 @@ async def import_data(
     payload: dict = Depends(require_super_admin)
 ):
     """
-    Import data for a store from CSV or JSON file.
+    Start a background import for a store from a CSV or JSON file.
     data_type: 'modelos', 'produtos', 'clientes', 'vendas', or 'auto' (detect from file)
     Supports mapping of old numeric IDs to new UUIDs.
+    Returns the job id; progress is polled at /api/admin/import/jobs/{job_id}.
     """
     # Verify loja exists
     loja = await db.lojas.find_one({"id": loja_id}, {"_id": 0})
     if not loja:
         raise HTTPException(status_code=404, detail="Loja não encontrada")
     
-    # Read file content
-    content = await file.read()
     filename = file.filename.lower()
+    if filename.endswith('.json'):
+        suffix, iter_records = '.json', iter_json_records
+    elif filename.endswith('.csv'):
+        suffix, iter_records = '.csv', iter_csv_records
+    else:
+        raise HTTPException(status_code=400, detail="Formato não suportado. Use CSV ou JSON.")
     
-    # Parse file based on extension
+    # Spool to disk and read the first record to validate the file and detect its type
+    path = await spool_upload(file, suffix)
+    records = iter_records(path)
     try:
-        if filename.endswith('.json'):
-            data = json.loads(content.decode('utf-8'))
-            if not isinstance(data, list):
-                data = [data]
-        elif filename.endswith('.csv'):
-            import csv
-            import io
-            reader = csv.DictReader(io.StringIO(content.decode('utf-8')))
-            data = list(reader)
-        else:
-            raise HTTPException(status_code=400, detail="Formato não suportado. Use CSV ou JSON.")
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=400, detail="Arquivo JSON inválido")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Erro ao ler arquivo: {str(e)}")
-    
-    if not data:
-        raise HTTPException(status_code=400, detail="Arquivo vazio ou sem dados válidos")
-    
-    # Auto-detect data type from first record keys
-    if data_type == "auto":
-        first_record = data[0]
-        keys = set(first_record.keys())
-        
-        if 'imei' in keys or ('modelo_id' in keys and 'cor' in keys):
-            data_type = 'produtos'
-        elif 'cpf' in keys or 'whatsapp' in keys or 'telefone' in keys:
-            data_type = 'clientes'
-        elif ('nome' in keys and len(keys) <= 3) or (keys == {'id', 'nome'}):
-            data_type = 'modelos'
-        elif 'valor_total' in keys or 'forma_pagamento' in keys or 'cliente_id' in keys:
-            data_type = 'vendas'
-        else:
-            raise HTTPException(status_code=400, detail="Não foi possível detectar o tipo de dados. Especifique manualmente.")
-    
-    errors = []
-    imported = 0
-    details = {"created": [], "skipped": [], "id_mappings": {}}
-    
-    # Load existing ID mappings for this store (stored in a special collection)
-    id_map_doc = await db.import_id_mappings.find_one({"loja_id": loja_id}) or {"loja_id": loja_id, "modelos": {}, "clientes": {}, "produtos": {}}
-    modelos_id_map = id_map_doc.get("modelos", {})
-    clientes_id_map = id_map_doc.get("clientes", {})
-    produtos_id_map = id_map_doc.get("produtos", {})
-    
-    # Import based on data type
-    if data_type == 'modelos':
-        for i, record in enumerate(data):
-            try:
-                old_id = str(record.get('id', '')).strip()
-                nome = record.get('nome', '').strip()
-                marca = record.get('marca', '').strip()
-                
-                if not nome:
-                    errors.append(f"Linha {i+1}: Nome do modelo é obrigatório")
-                    continue
-                
-                # Check if model already exists by name
-                existing = await db.modelos.find_one({
-                    "nome": {"$regex": f"^{re.escape(nome)}$", "$options": "i"},
-                    "loja_id": loja_id
-                })
-                
-                if existing:
-                    # Map old ID to existing UUID
-                    if old_id:
-                        modelos_id_map[old_id] = existing["id"]
-                    details["skipped"].append(nome)
-                    continue
-                
-                new_id = str(uuid.uuid4())
-                modelo_doc = {
-                    "id": new_id,
-                    "nome": nome,
-                    "marca": marca,
-                    "loja_id": loja_id,
-                    "created_at": datetime.now(timezone.utc).isoformat()
-                }
-                await db.modelos.insert_one(modelo_doc)
-                
-                # Save ID mapping
-                if old_id:
-                    modelos_id_map[old_id] = new_id
-                
-                details["created"].append(nome)
-                imported += 1
-            except Exception as e:
-                errors.append(f"Linha {i+1}: {str(e)}")
-    
-    elif data_type == 'clientes':
-        for i, record in enumerate(data):
-            try:
-                old_id = str(record.get('id', '')).strip()
-                nome = record.get('nome', '').strip()
-                cpf = record.get('cpf', '').strip()
-                whatsapp = record.get('whatsapp', record.get('telefone', '')).strip()
-                email = record.get('email', '').strip()
-                endereco = record.get('endereco', '').strip()
-                
-                if not nome:
-                    errors.append(f"Linha {i+1}: Nome do cliente é obrigatório")
-                    continue
-                
-                # Check if client already exists by CPF or name
-                existing = None
-                if cpf:
-                    existing = await db.clientes.find_one({"cpf": cpf, "loja_id": loja_id})
-                if not existing:
-                    existing = await db.clientes.find_one({
-                        "nome": {"$regex": f"^{re.escape(nome)}$", "$options": "i"},
-                        "loja_id": loja_id
-                    })
-                
-                if existing:
-                    if old_id:
-                        clientes_id_map[old_id] = existing["id"]
-                    details["skipped"].append(nome)
-                    continue
-                
-                new_id = str(uuid.uuid4())
-                cliente_doc = {
-                    "id": new_id,
-                    "nome": nome,
-                    "cpf": cpf,
-                    "whatsapp": whatsapp,
-                    "email": email,
-                    "endereco": endereco,
-                    "loja_id": loja_id,
-                    "created_at": datetime.now(timezone.utc).isoformat()
-                }
-                await db.clientes.insert_one(cliente_doc)
-                
-                if old_id:
-                    clientes_id_map[old_id] = new_id
-                
-                details["created"].append(nome)
-                imported += 1
-            except Exception as e:
-                errors.append(f"Linha {i+1}: {str(e)}")
-    
-    elif data_type == 'produtos':
-        # Load models cache (by name and by old ID)
-        modelos_cache_by_name = {}
-        existing_modelos = await db.modelos.find({"loja_id": loja_id}, {"_id": 0}).to_list(1000)
-        for m in existing_modelos:
-            modelos_cache_by_name[m["nome"].lower()] = m["id"]
+        try:
+            first = await asyncio.to_thread(next, records, None)
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="Arquivo JSON inválido")
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Erro ao ler arquivo: {str(e)}")
         
-        for i, record in enumerate(data):
-            try:
-                old_id = str(record.get('id', '')).strip()
-                old_modelo_id = str(record.get('modelo_id', '')).strip()
-                modelo_nome = record.get('modelo', record.get('modelo_nome', '')).strip()
-                cor = record.get('cor', '').strip()
-                memoria = record.get('memoria', '').strip()
-                bateria = str(record.get('bateria', record.get('saude_bateria', ''))).strip()
-                imei = record.get('imei', '').strip()
-                preco = record.get('preco', record.get('valor', 0))
-                vendido = str(record.get('vendido', 'false')).lower() in ['true', '1', 'yes', 'sim']
-                
-                # Try to get modelo_id from mapping or by name
-                modelo_id = None
-                
-                # First try old_modelo_id mapping
-                if old_modelo_id and old_modelo_id in modelos_id_map:
-                    modelo_id = modelos_id_map[old_modelo_id]
-                
-                # Then try by name
-                if not modelo_id and modelo_nome:
-                    modelo_id = modelos_cache_by_name.get(modelo_nome.lower())
-                
-                # If still no modelo_id, skip (model must be imported first)
-                if not modelo_id:
-                    if old_modelo_id:
-                        errors.append(f"Linha {i+1}: Modelo ID {old_modelo_id} não encontrado. Importe modelos primeiro.")
-                    else:
-                        errors.append(f"Linha {i+1}: Modelo é obrigatório")
-                    continue
-                
-                # Check if product with same IMEI exists
-                if imei:
-                    existing = await db.produtos.find_one({"imei": imei, "loja_id": loja_id})
-                    if existing:
-                        if old_id:
-                            produtos_id_map[old_id] = existing["id"]
-                        details["skipped"].append(f"IMEI {imei}")
-                        continue
-                
-                # Convert price to float
-                try:
-                    preco = float(str(preco).replace('R$', '').replace(',', '.').strip())
-                except:
-                    preco = 0.0
-                
-                # Convert bateria to string
-                if bateria:
-                    try:
-                        bateria = str(int(float(bateria)))
-                    except:
-                        pass
-                
-                new_id = str(uuid.uuid4())
-                produto_doc = {
-                    "id": new_id,
-                    "modelo_id": modelo_id,
-                    "cor": cor,
-                    "memoria": memoria,
-                    "bateria": bateria,
-                    "imei": imei,
-                    "preco": preco,
-                    "vendido": vendido,
-                    "loja_id": loja_id,
-                    "created_at": datetime.now(timezone.utc).isoformat()
-                }
-                await db.produtos.insert_one(produto_doc)
-                
-                if old_id:
-                    produtos_id_map[old_id] = new_id
-                
-                # Get modelo name for display
-                modelo = await db.modelos.find_one({"id": modelo_id}, {"_id": 0})
-                display_name = modelo["nome"] if modelo else "?"
-                details["created"].append(f"{display_name} ({cor})")
-                imported += 1
-            except Exception as e:
-                errors.append(f"Linha {i+1}: {str(e)}")
-    
-    elif data_type == 'vendas':
-        # Load clientes cache (by name and by old ID)
-        clientes_cache_by_name = {}
-        existing_clientes = await db.clientes.find({"loja_id": loja_id}, {"_id": 0}).to_list(10000)
-        for c in existing_clientes:
-            if c.get("cpf"):
-                clientes_cache_by_name[c["cpf"]] = c["id"]
-            clientes_cache_by_name[c["nome"].lower()] = c["id"]
+        if first is None:
+            raise HTTPException(status_code=400, detail="Arquivo vazio ou sem dados válidos")
         
-        for i, record in enumerate(data):
-            try:
-                old_cliente_id = str(record.get('cliente_id', '')).strip()
-                cliente_cpf = record.get('cliente_cpf', record.get('cpf', '')).strip()
-                cliente_nome = record.get('cliente_nome', record.get('cliente', '')).strip()
-                
-                # Try to get cliente_id from mapping or by CPF/name
-                cliente_id = None
-                
-                # First try old_cliente_id mapping
-                if old_cliente_id and old_cliente_id in clientes_id_map:
-                    cliente_id = clientes_id_map[old_cliente_id]
-                
-                # Then try by CPF
-                if not cliente_id and cliente_cpf:
-                    cliente_id = clientes_cache_by_name.get(cliente_cpf)
-                
-                # Then try by name
-                if not cliente_id and cliente_nome:
-                    cliente_id = clientes_cache_by_name.get(cliente_nome.lower())
-                
-                # If still no cliente_id, check if we have old ID
-                if not cliente_id and old_cliente_id:
-                    errors.append(f"Linha {i+1}: Cliente ID {old_cliente_id} não encontrado. Importe clientes primeiro.")
-                    continue
-                
-                if not cliente_id:
-                    errors.append(f"Linha {i+1}: Cliente não identificado")
-                    continue
-                
-                # Get cliente name for display
-                cliente_doc = await db.clientes.find_one({"id": cliente_id}, {"_id": 0})
-                cliente_display = cliente_doc["nome"] if cliente_doc else "?"
-                
-                # Parse value
-                valor_total = record.get('valor_total', record.get('total', 0))
-                try:
-                    valor_total = float(str(valor_total).replace('R$', '').replace(',', '.').strip())
-                except:
-                    valor_total = 0.0
-                
-                # Parse date - support ISO format from database export
-                data_venda = record.get('data', record.get('data_venda', ''))
-                if data_venda:
-                    try:
-                        data_str = str(data_venda).strip()
-                        # Try ISO format first (from database export)
-                        if 'T' in data_str or '+' in data_str or len(data_str) > 10:
-                            # ISO format: 2025-07-09 13:42:14.925264+00 or 2025-07-09T13:42:14
-                            data_str = data_str.split('+')[0].split('.')[0].replace('T', ' ')
-                            try:
-                                data_venda = datetime.strptime(data_str, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-                            except:
-                                data_venda = datetime.strptime(data_str.split(' ')[0], '%Y-%m-%d').replace(tzinfo=timezone.utc)
-                        else:
-                            # Try other formats
-                            for fmt in ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y']:
-                                try:
-                                    data_venda = datetime.strptime(data_str, fmt).replace(tzinfo=timezone.utc)
-                                    break
-                                except:
-                                    continue
-                        if isinstance(data_venda, str):
-                            data_venda = datetime.now(timezone.utc)
-                    except:
-                        data_venda = datetime.now(timezone.utc)
-                else:
-                    data_venda = datetime.now(timezone.utc)
-                
-                # Parse forma_pagamento - support variations
-                forma_pagamento = record.get('forma_pagamento', record.get('pagamento', 'dinheiro')).strip()
-                forma_map = {
-                    'pix': 'pix', 'dinheiro': 'dinheiro', 'cartão': 'cartao_credito',
-                    'cartao': 'cartao_credito', 'credito': 'cartao_credito', 'débito': 'cartao_debito',
-                    'debito': 'cartao_debito', 'transferencia': 'transferencia', 'outra': 'dinheiro'
-                }
-                forma_pagamento = forma_map.get(forma_pagamento.lower(), 'dinheiro')
-                
-                observacao = record.get('observacao', record.get('obs', '')).strip()
-                
-                # Parse items - support JSON string from database export
-                itens_raw = record.get('itens', '[]')
-                itens = []
-                
-                if isinstance(itens_raw, str) and itens_raw.strip():
-                    try:
-                        # Clean up escaped JSON
-                        clean_json = itens_raw.strip().strip('"').replace('\\"', '"').replace('\\\\', '\\')
-                        parsed_itens = json.loads(clean_json)
-                        
-                        # Transform items to our format
-                        for item in parsed_itens:
-                            modelo_info = item.get('modelo', {})
-                            itens.append({
-                                "produto_id": str(item.get('id', uuid.uuid4())),
-                                "modelo_nome": modelo_info.get('nome', item.get('modelo_nome', 'Produto')),
-                                "cor": item.get('cor', ''),
-                                "memoria": str(item.get('memoria', '')),
-                                "preco": float(item.get('preco', 0))
-                            })
-                    except:
-                        pass
-                
-                # If no items parsed, create generic item
-                if not itens:
-                    itens = [{
-                        "produto_id": str(uuid.uuid4()),
-                        "modelo_nome": "Produto Importado",
-                        "cor": "",
-                        "memoria": "",
-                        "preco": valor_total
-                    }]
-                
-                venda_doc = {
-                    "id": str(uuid.uuid4()),
-                    "cliente_id": cliente_id,
-                    "itens": json.dumps(itens),
-                    "valor_total": valor_total,
-                    "forma_pagamento": forma_pagamento,
-                    "observacao": observacao,
-                    "data": data_venda.isoformat(),
-                    "loja_id": loja_id
-                }
-                await db.vendas_concluidas.insert_one(venda_doc)
-                details["created"].append(f"R$ {valor_total:.2f} - {cliente_display}")
-                imported += 1
-            except Exception as e:
-                errors.append(f"Linha {i+1}: {str(e)}")
+        # Auto-detect data type from first record keys
+        if data_type == "auto":
+            data_type = detect_import_type(first) if isinstance(first, dict) else None
+            if not data_type:
+                raise HTTPException(status_code=400, detail="Não foi possível detectar o tipo de dados. Especifique manualmente.")
+        if data_type not in BulkImporter.COLLECTIONS:
+            raise HTTPException(status_code=400, detail=f"Tipo de dados '{data_type}' não suportado para importação")
+    except HTTPException:
+        discard_upload(records, path)
+        raise
     
-    else:
-        raise HTTPException(status_code=400, detail=f"Tipo de dados '{data_type}' não suportado para importação")
+    now = datetime.now(timezone.utc).isoformat()
+    job = {
+        "id": str(uuid.uuid4()),
+        "loja_id": loja_id,
+        "data_type": data_type,
+        "filename": file.filename,
+        "status": "queued",
+        "processed": 0,
+        "imported": 0,
+        "skipped": 0,
+        "error_count": 0,
+        "created_at": now,
+        "updated_at": now
+    }
+    try:
+        await db.import_jobs.insert_one(job)
+    except Exception:
+        discard_upload(records, path)
+        raise
     
-    # Save ID mappings for future imports
-    await db.import_id_mappings.update_one(
-        {"loja_id": loja_id},
+    spawn_background(run_import_job(job["id"], loja_id, data_type, first, records, path))
+    return {"job_id": job["id"], "status": job["status"], "data_type": data_type}
+
+@admin_router.get("/import/jobs/{job_id}", response_model=ImportJob)
+async def get_import_job(job_id: str, payload: dict = Depends(require_super_admin)):
+    job = await db.import_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Importação não encontrada")
+    if job["status"] in ("queued", "running") and await fail_stale_import_jobs({"id": job_id}):
+        job = await db.import_jobs.find_one({"id": job_id}, {"_id": 0})
+    return ImportJob(**job)
+
+async def fail_stale_import_jobs(extra_filter: Optional[dict] = None) -> int:
+    """
+    Mark queued/running jobs with no progress for IMPORT_JOB_STALE_SECONDS as failed.
+    Jobs die with the worker that ran them (restart, crash); without this they stay
+    'running' forever. Live jobs bump updated_at after every batch.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=IMPORT_JOB_STALE_SECONDS)).isoformat()
+    result = await db.import_jobs.update_many(
+        {**(extra_filter or {}), "status": {"$in": ["queued", "running"]}, "updated_at": {"$lt": cutoff}},
         {"$set": {
-            "loja_id": loja_id,
-            "modelos": modelos_id_map,
-            "clientes": clientes_id_map,
-            "produtos": produtos_id_map
-        }},
-        upsert=True
-    )
-    
-    return ImportResult(
-        success=len(errors) == 0,
-        total_records=len(data),
-        imported=imported,
-        errors=errors[:20],  # Limit errors to first 20
-        details={
-            "created_count": len(details["created"]),
-            "skipped_count": len(details["skipped"]),
-            "sample_created": details["created"][:10],
-            "sample_skipped": details["skipped"][:10]
-        }
+            "status": "failed",
+            "error": "Importação interrompida (servidor reiniciado). Envie o arquivo novamente.",
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }}
     )
+    return result.modified_count
 
 @admin_router.get("/usuarios", response_model=List[UsuarioResponse])
 async def list_usuarios(payload: dict = Depends(require_super_admin)):
     usuarios = await db.usuarios.find({}, {"_id": 0, "senha": 0}).to_list(1000)
+    loja_nomes = await get_loja_nomes(u.get("loja_id") for u in usuarios)
     result = []
     for user in usuarios:
-        loja_nome = None
-        if user.get("loja_id"):
-            loja = await db.lojas.find_one({"id": user["loja_id"]}, {"_id": 0})
-            if loja:
-                loja_nome = loja["nome"]
+        loja_nome = loja_nomes.get(user.get("loja_id"))
         # Ensure nome field exists (backward compatibility)
         if "nome" not in user:
             user["nome"] = user.get("email", "").split("@")[0]
@@ -944,7 +2002,7 @@ async def create_usuario(usuario: UsuarioCreate, payload: dict = Depends(require
         loja_id=usuario.loja_id
     )
     doc = user_obj.model_dump()
-    doc['senha'] = usuario.senha
+    doc['senha'] = await hash_password(usuario.senha)
     doc['created_at'] = doc['created_at'].isoformat()
     await db.usuarios.insert_one(doc)
     
@@ -961,10 +2019,14 @@ async def update_usuario(user_id: str, usuario: UsuarioUpdate, payload: dict = D
     update_data = {k: v for k, v in usuario.model_dump().items() if v is not None}
     if not update_data:
         raise HTTPException(status_code=400, detail="Nenhum campo para atualizar")
+    if "senha" in update_data:
+        update_data["senha"] = await hash_password(update_data["senha"])
     
     result = await db.usuarios.update_one({"id": user_id}, {"$set": update_data})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
+    if "senha" in update_data or update_data.get("ativo") is False:
+        await revoke_user_tokens(user_id)
     
     updated = await db.usuarios.find_one({"id": user_id}, {"_id": 0, "senha": 0})
     loja_nome = None
@@ -980,29 +2042,32 @@ async def delete_usuario(user_id: str, payload: dict = Depends(require_super_adm
     result = await db.usuarios.delete_one({"id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
+    await revoke_user_tokens(user_id)
     return {"message": "Usuário excluído com sucesso"}
 
 # ============== LOJA ROUTES ==============
 
 @loja_router.get("/{slug}/dashboard", response_model=DashboardStats)
-async def loja_dashboard(slug: str, mes: Optional[str] = None, payload: dict = Depends(require_loja_access)):
+async def loja_dashboard(slug: str, response: Response, mes: Optional[str] = None, payload: dict = Depends(require_loja_access)):
     loja = await verify_loja_access(slug, payload)
     loja_id = loja["id"]
     
-    total_modelos = await db.modelos.count_documents({"loja_id": loja_id})
-    total_produtos = await db.produtos.count_documents({"loja_id": loja_id, "vendido": False})
-    total_clientes = await db.clientes.count_documents({"loja_id": loja_id})
-    total_vendas = await db.vendas_concluidas.count_documents({"loja_id": loja_id})
+    cache_key = await dashboard_cache_key(loja_id, mes)
+    cached = dashboard_cache.get(cache_key)
+    if cached is not None:
+        response.headers["X-Cache"] = "HIT"
+        return cached
+    response.headers["X-Cache"] = "MISS"
     
-    vendas = await db.vendas_concluidas.find({"loja_id": loja_id}, {"_id": 0}).to_list(1000)
-    valor_total_vendas = sum(v.get("valor_total", 0) for v in vendas)
+    stats = (await get_loja_counters([loja_id]))[loja_id]
     
     modelos = await db.modelos.find({"loja_id": loja_id}, {"_id": 0}).to_list(1000)
+    estoque = await get_estoque_por_modelo(loja_id)
     modelos_com_estoque = []
     modelos_sem_estoque = []
     
     for modelo in modelos:
-        count = await db.produtos.count_documents({"modelo_id": modelo["id"], "vendido": False})
+        count = estoque.get(modelo["id"], 0)
         modelo_with_qty = ModeloWithQuantity(**modelo, quantidade_produtos=count)
         if count > 0:
             modelos_com_estoque.append(modelo_with_qty)
@@ -1010,59 +2075,35 @@ async def loja_dashboard(slug: str, mes: Optional[str] = None, payload: dict = D
             modelos_sem_estoque.append(Modelo(**modelo))
     
     # Top models
-    modelo_sales = {}
-    filtered_vendas = vendas
-    if mes:
-        filtered_vendas = [v for v in vendas if v.get("data", "").startswith(mes)]
-    
-    for venda in filtered_vendas:
-        try:
-            itens = json.loads(venda.get("itens", "[]"))
-            for item in itens:
-                modelo_id = item.get("modelo_id")
-                modelo_nome = item.get("modelo_nome", "")
-                if modelo_id:
-                    if modelo_id not in modelo_sales:
-                        modelo_sales[modelo_id] = {"nome": modelo_nome, "quantidade": 0, "valor": 0}
-                    modelo_sales[modelo_id]["quantidade"] += 1
-                    modelo_sales[modelo_id]["valor"] += item.get("preco", 0)
-        except:
-            pass
-    
-    top_modelos = [
-        {"modelo_id": k, **v} 
-        for k, v in sorted(modelo_sales.items(), key=lambda x: x[1]["quantidade"], reverse=True)[:10]
-    ]
+    top_modelos = await get_top_modelos(loja_id, mes)
     
-    return DashboardStats(
-        total_modelos=total_modelos,
-        total_produtos=total_produtos,
-        total_clientes=total_clientes,
-        total_vendas=total_vendas,
-        valor_total_vendas=valor_total_vendas,
+    dashboard = DashboardStats(
+        **stats,
         modelos_com_estoque=modelos_com_estoque,
         modelos_sem_estoque=modelos_sem_estoque,
         top_modelos=top_modelos
     )
+    dashboard_cache.set(cache_key, dashboard)
+    return dashboard
 
 # Verify store exists (public endpoint)
 @loja_router.get("/{slug}/verify")
 async def verify_loja(slug: str):
-    loja = await db.lojas.find_one({"slug": slug, "ativo": True}, {"_id": 0})
-    if not loja:
-        raise HTTPException(status_code=404, detail="Loja não encontrada")
+    loja = await get_loja_by_slug(slug)
     return {"exists": True, "nome": loja["nome"], "slug": loja["slug"], "logo_url": loja.get("logo_url")}
 
 # Modelos
 @loja_router.get("/{slug}/modelos", response_model=List[ModeloWithQuantity])
-async def list_modelos(slug: str, payload: dict = Depends(require_loja_access)):
+async def list_modelos(slug: str, request: Request, response: Response, payload: dict = Depends(require_loja_access)):
     loja = await verify_loja_access(slug, payload)
+    etag = await list_etag(loja["id"], "modelos", request)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
     modelos = await db.modelos.find({"loja_id": loja["id"]}, {"_id": 0}).to_list(1000)
-    result = []
-    for modelo in modelos:
-        count = await db.produtos.count_documents({"modelo_id": modelo["id"], "vendido": False})
-        result.append(ModeloWithQuantity(**modelo, quantidade_produtos=count))
-    return result
+    estoque = await get_estoque_por_modelo(loja["id"])
+    rows = [MODELO_ROW(modelo, quantidade_produtos=estoque.get(modelo["id"], 0)) for modelo in modelos]
+    return list_response(response, ModeloWithQuantity, rows)
 
 @loja_router.post("/{slug}/modelos", response_model=Modelo)
 async def create_modelo(slug: str, modelo: ModeloCreate, payload: dict = Depends(require_loja_access)):
@@ -1071,6 +2112,8 @@ async def create_modelo(slug: str, modelo: ModeloCreate, payload: dict = Depends
     doc = modelo_obj.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
     await db.modelos.insert_one(doc)
+    await inc_loja_stats(loja["id"], total_modelos=1)
+    await mark_loja_changed(loja["id"], "modelos")
     return modelo_obj
 
 @loja_router.get("/{slug}/modelos/{modelo_id}", response_model=ModeloWithQuantity)
@@ -1092,6 +2135,7 @@ async def update_modelo(slug: str, modelo_id: str, modelo: ModeloCreate, payload
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Modelo não encontrado")
     updated = await db.modelos.find_one({"id": modelo_id}, {"_id": 0})
+    await mark_loja_changed(loja["id"], "modelos")
     return Modelo(**updated)
 
 @loja_router.delete("/{slug}/modelos/{modelo_id}")
@@ -1103,12 +2147,24 @@ async def delete_modelo(slug: str, modelo_id: str, payload: dict = Depends(requi
     result = await db.modelos.delete_one({"id": modelo_id, "loja_id": loja["id"]})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Modelo não encontrado")
+    await inc_loja_stats(loja["id"], total_modelos=-1)
+    await mark_loja_changed(loja["id"], "modelos")
     return {"message": "Modelo excluído com sucesso"}
 
 # Produtos
+def normalize_produto(produto: dict) -> dict:
+    """Ensure armazenamento exists (imported and legacy rows only have 'memoria')."""
+    if "armazenamento" not in produto:
+        produto["armazenamento"] = produto.get("memoria", "")
+    return produto
+
 @loja_router.get("/{slug}/produtos", response_model=List[ProdutoWithModelo])
-async def list_produtos(slug: str, modelo_id: Optional[str] = None, vendido: Optional[bool] = None, payload: dict = Depends(require_loja_access)):
+async def list_produtos(slug: str, request: Request, response: Response, modelo_id: Optional[str] = None, vendido: Optional[bool] = None, payload: dict = Depends(require_loja_access)):
     loja = await verify_loja_access(slug, payload)
+    etag = await list_etag(loja["id"], "produtos", request)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
     query = {"loja_id": loja["id"]}
     if modelo_id:
         query["modelo_id"] = modelo_id
@@ -1124,17 +2180,12 @@ async def list_produtos(slug: str, modelo_id: Optional[str] = None, vendido: Opt
     if produtos:
         logging.info(f"Primeiro produto: {produtos[0]}")
     
+    modelo_nomes = await get_modelo_nomes(p["modelo_id"] for p in produtos)
     result = []
     for produto in produtos:
-        modelo = await db.modelos.find_one({"id": produto["modelo_id"]}, {"_id": 0})
-        modelo_nome = modelo["nome"] if modelo else "Modelo removido"
-        # Normalize: ensure armazenamento field exists (handle legacy 'memoria' field)
-        if "armazenamento" not in produto and "memoria" in produto:
-            produto["armazenamento"] = produto["memoria"]
-        elif "armazenamento" not in produto:
-            produto["armazenamento"] = ""
-        result.append(ProdutoWithModelo(**produto, modelo_nome=modelo_nome))
-    return result
+        modelo_nome = modelo_nomes.get(produto["modelo_id"], "Modelo removido")
+        result.append(PRODUTO_ROW(normalize_produto(produto), modelo_nome=modelo_nome))
+    return list_response(response, ProdutoWithModelo, result)
 
 @loja_router.post("/{slug}/produtos", response_model=Produto)
 async def create_produto(slug: str, produto: ProdutoCreate, payload: dict = Depends(require_loja_access)):
@@ -1170,6 +2221,8 @@ async def create_produto(slug: str, produto: ProdutoCreate, payload: dict = Depe
         logging.info(f"Documento a inserir com loja_id={doc.get('loja_id')}: {doc}")
         result = await db.produtos.insert_one(doc)
         logging.info(f"Produto inserido com ID MongoDB: {result.inserted_id}")
+        await inc_loja_stats(loja["id"], total_produtos=1)
+        await mark_loja_changed(loja["id"], "produtos")
         
         # Verificar se realmente foi inserido
         verify = await db.produtos.find_one({"id": produto_obj.id}, {"_id": 0})
@@ -1192,9 +2245,9 @@ async def get_produto(slug: str, produto_id: str, payload: dict = Depends(requir
     produto = await db.produtos.find_one({"id": produto_id, "loja_id": loja["id"]}, {"_id": 0})
     if not produto:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
-    modelo = await db.modelos.find_one({"id": produto["modelo_id"]}, {"_id": 0})
-    modelo_nome = modelo["nome"] if modelo else "Modelo removido"
-    return ProdutoWithModelo(**produto, modelo_nome=modelo_nome)
+    modelo_nomes = await get_modelo_nomes([produto["modelo_id"]])
+    modelo_nome = modelo_nomes.get(produto["modelo_id"], "Modelo removido")
+    return ProdutoWithModelo(**normalize_produto(produto), modelo_nome=modelo_nome)
 
 @loja_router.put("/{slug}/produtos/{produto_id}", response_model=Produto)
 async def update_produto(slug: str, produto_id: str, produto: ProdutoUpdate, payload: dict = Depends(require_loja_access)):
@@ -1210,22 +2263,30 @@ async def update_produto(slug: str, produto_id: str, produto: ProdutoUpdate, pay
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
     updated = await db.produtos.find_one({"id": produto_id}, {"_id": 0})
+    await mark_loja_changed(loja["id"], "produtos")
     return Produto(**updated)
 
 @loja_router.delete("/{slug}/produtos/{produto_id}")
 async def delete_produto(slug: str, produto_id: str, payload: dict = Depends(require_loja_access)):
     loja = await verify_loja_access(slug, payload)
-    result = await db.produtos.delete_one({"id": produto_id, "loja_id": loja["id"]})
-    if result.deleted_count == 0:
+    deleted = await db.produtos.find_one_and_delete({"id": produto_id, "loja_id": loja["id"]}, {"_id": 0, "vendido": 1})
+    if not deleted:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
+    if not deleted.get("vendido", False):
+        await inc_loja_stats(loja["id"], total_produtos=-1)
+    await mark_loja_changed(loja["id"], "produtos")
     return {"message": "Produto excluído com sucesso"}
 
 # Clientes
 @loja_router.get("/{slug}/clientes", response_model=List[Cliente])
-async def list_clientes(slug: str, payload: dict = Depends(require_loja_access)):
+async def list_clientes(slug: str, request: Request, response: Response, payload: dict = Depends(require_loja_access)):
     loja = await verify_loja_access(slug, payload)
+    etag = await list_etag(loja["id"], "clientes", request)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
     clientes = await db.clientes.find({"loja_id": loja["id"]}, {"_id": 0}).to_list(1000)
-    return [Cliente(**c) for c in clientes]
+    return list_response(response, Cliente, [CLIENTE_ROW(c) for c in clientes])
 
 @loja_router.post("/{slug}/clientes", response_model=Cliente)
 async def create_cliente(slug: str, cliente: ClienteCreate, payload: dict = Depends(require_loja_access)):
@@ -1239,6 +2300,8 @@ async def create_cliente(slug: str, cliente: ClienteCreate, payload: dict = Depe
     doc = cliente_obj.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
     await db.clientes.insert_one(doc)
+    await inc_loja_stats(loja["id"], total_clientes=1)
+    await mark_loja_changed(loja["id"], "clientes")
     return cliente_obj
 
 @loja_router.get("/{slug}/clientes/{cliente_id}", response_model=Cliente)
@@ -1269,6 +2332,7 @@ async def update_cliente(slug: str, cliente_id: str, cliente: ClienteUpdate, pay
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
     updated = await db.clientes.find_one({"id": cliente_id}, {"_id": 0})
+    await mark_loja_changed(loja["id"], "clientes")
     return Cliente(**updated)
 
 @loja_router.delete("/{slug}/clientes/{cliente_id}")
@@ -1277,6 +2341,8 @@ async def delete_cliente(slug: str, cliente_id: str, payload: dict = Depends(req
     result = await db.clientes.delete_one({"id": cliente_id, "loja_id": loja["id"]})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
+    await inc_loja_stats(loja["id"], total_clientes=-1)
+    await mark_loja_changed(loja["id"], "clientes")
     return {"message": "Cliente excluído com sucesso"}
 
 # Cliente History
@@ -1300,7 +2366,7 @@ async def get_cliente_historico(slug: str, cliente_id: str, payload: dict = Depe
     trocas = []
     
     for venda in vendas:
-        itens_parsed = json.loads(venda.get("itens", "[]"))
+        itens_parsed = parse_itens(venda.get("itens"))
         garantia_status = get_garantia_status(venda.get("garantia_ate"))
         
         # Add purchase record
@@ -1376,22 +2442,66 @@ def get_garantia_status(garantia_ate: Optional[str]) -> str:
 
 # Vendas
 @loja_router.get("/{slug}/vendas", response_model=List[VendaConcluidaResponse])
-async def list_vendas(slug: str, payload: dict = Depends(require_loja_access)):
+async def list_vendas(
+    slug: str,
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cliente_id: Optional[str] = None,
+    forma_pagamento: Optional[str] = None,
+    payload: dict = Depends(require_loja_access)
+):
+    """
+    List sales, newest first.
+    Filters: since (inclusive), until (exclusive), cliente_id, forma_pagamento.
+    When `limit` is given the result is a keyset page ordered by (data, id); the token
+    for the next page is returned in the X-Next-Cursor header and passed back as `cursor`.
+    """
     loja = await verify_loja_access(slug, payload)
-    vendas = await db.vendas_concluidas.find({"loja_id": loja["id"]}, {"_id": 0}).to_list(10000)
+    etag = await list_etag(loja["id"], "vendas", request)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    
+    query = {"loja_id": loja["id"]}
+    if since or until:
+        query["data"] = {}
+        if since:
+            query["data"]["$gte"] = to_utc_iso(since)
+        if until:
+            query["data"]["$lt"] = to_utc_iso(until)
+    if cliente_id:
+        query["cliente_id"] = cliente_id
+    if forma_pagamento:
+        query["forma_pagamento"] = forma_pagamento
+    if cursor:
+        if not limit:
+            raise HTTPException(status_code=400, detail="Cursor requer limit")
+        cursor_data, cursor_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"data": {"$lt": cursor_data}},
+            {"data": cursor_data, "id": {"$lt": cursor_id}}
+        ]
+    
+    find = db.vendas_concluidas.find(query, {"_id": 0}).sort([("data", -1), ("id", -1)])
+    if limit:
+        # Fetch one extra row to know whether there is a next page
+        vendas = await find.limit(limit + 1).to_list(limit + 1)
+        if len(vendas) > limit:
+            vendas = vendas[:limit]
+            response.headers["X-Next-Cursor"] = encode_cursor(vendas[-1]["data"], vendas[-1]["id"])
+    else:
+        vendas = await find.to_list(10000)
+    cliente_nomes = await get_cliente_nomes(v["cliente_id"] for v in vendas)
     result = []
     for venda in vendas:
-        cliente = await db.clientes.find_one({"id": venda["cliente_id"]}, {"_id": 0})
-        cliente_nome = cliente["nome"] if cliente else "Cliente removido"
-        itens_parsed = json.loads(venda.get("itens", "[]"))
+        cliente_nome = cliente_nomes.get(venda["cliente_id"], "Cliente removido")
         garantia_status = get_garantia_status(venda.get("garantia_ate"))
-        result.append(VendaConcluidaResponse(
-            **venda,
-            cliente_nome=cliente_nome,
-            itens_parsed=[VendaItem(**item) for item in itens_parsed],
-            garantia_status=garantia_status
-        ))
-    return result
+        result.append(venda_row(venda, cliente_nome, garantia_status))
+    return list_response(response, VendaConcluidaResponse, result)
 
 @loja_router.post("/{slug}/vendas", response_model=VendaConcluidaResponse)
 async def create_venda(slug: str, venda: VendaCreate, payload: dict = Depends(require_loja_access)):
@@ -1437,9 +2547,6 @@ async def create_venda(slug: str, venda: VendaCreate, payload: dict = Depends(re
             valor_compra=venda.troca.valor_recebido,
             loja_id=loja["id"]
         )
-        troca_doc = produto_troca.model_dump()
-        troca_doc["created_at"] = troca_doc["created_at"].isoformat()
-        await db.produtos.insert_one(troca_doc)
 
         desconto_troca = venda.troca.valor_recebido
         memoria_ram_troca = (venda.troca.memoria_ram or "").strip()
@@ -1449,29 +2556,33 @@ async def create_venda(slug: str, venda: VendaCreate, payload: dict = Depends(re
         detalhe_troca += f" por R$ {venda.troca.valor_recebido:.2f}."
         observacao_venda = f"{venda.observacao}\n{detalhe_troca}" if venda.observacao else detalhe_troca
     
-    for produto_id in venda.produtos:
-        produto = await db.produtos.find_one({"id": produto_id, "loja_id": loja["id"]}, {"_id": 0})
+    # Fetch the whole basket at once (duplicated ids count once)
+    produto_ids = list(dict.fromkeys(venda.produtos))
+    encontrados = await db.produtos.find(
+        {"id": {"$in": produto_ids}, "loja_id": loja["id"]}, {"_id": 0}
+    ).to_list(len(produto_ids))
+    por_id = {p["id"]: p for p in encontrados}
+    produtos = []
+    for produto_id in produto_ids:
+        produto = por_id.get(produto_id)
         if not produto:
             raise HTTPException(status_code=404, detail=f"Produto {produto_id} não encontrado")
         if produto.get("vendido", False):
             raise HTTPException(status_code=400, detail=f"Produto {produto_id} já foi vendido")
-        
-        modelo = await db.modelos.find_one({"id": produto["modelo_id"]}, {"_id": 0})
-        modelo_nome = modelo["nome"] if modelo else "Modelo removido"
-        
+        produtos.append(produto)
+    
+    modelo_nomes = await get_modelo_nomes(p["modelo_id"] for p in produtos)
+    for produto in produtos:
         itens.append({
             "produto_id": produto["id"],
             "modelo_id": produto["modelo_id"],
-            "modelo_nome": modelo_nome,
+            "modelo_nome": modelo_nomes.get(produto["modelo_id"], "Modelo removido"),
             "cor": produto["cor"],
             "memoria": produto.get("armazenamento") or produto.get("memoria", ""),
             "preco": produto["preco"]
         })
         valor_total += produto["preco"]
     
-    for produto_id in venda.produtos:
-        await db.produtos.update_one({"id": produto_id}, {"$set": {"vendido": True}})
-    
     # Calculate warranty dates
     garantia_inicio = None
     garantia_ate = None
@@ -1503,7 +2614,7 @@ async def create_venda(slug: str, venda: VendaCreate, payload: dict = Depends(re
     
     venda_obj = VendaConcluida(
         loja_id=loja["id"],
-        itens=json.dumps(itens),
+        itens=itens,
         subtotal=subtotal,
         desconto=desconto,
         valor_total=valor_total,
@@ -1517,13 +2628,37 @@ async def create_venda(slug: str, venda: VendaCreate, payload: dict = Depends(re
     
     doc = venda_obj.model_dump()
     doc['data'] = doc['data'].isoformat()
-    await db.vendas_concluidas.insert_one(doc)
+    doc['rollup'] = True  # counted below, not by the backfill
     
-    return VendaConcluidaResponse(
-        **venda_obj.model_dump(),
-        cliente_nome=cliente["nome"],
-        itens_parsed=[VendaItem(**item) for item in itens]
+    # Reserve every product in one conditional write; a concurrent checkout that got
+    # any of them first makes the counts differ, and our partial reservation is undone.
+    reserva = await db.produtos.update_many(
+        {"id": {"$in": produto_ids}, "loja_id": loja["id"], "vendido": False},
+        {"$set": {"vendido": True, "venda_id": venda_obj.id}}
+    )
+    if reserva.modified_count != len(produto_ids):
+        await release_produtos(loja["id"], venda_obj.id)
+        raise HTTPException(status_code=409, detail="Um ou mais produtos foram vendidos por outra venda. Atualize a lista e tente novamente.")
+    try:
+        await db.vendas_concluidas.insert_one(doc)
+    except Exception:
+        await release_produtos(loja["id"], venda_obj.id)
+        raise
+    
+    if venda.possui_troca:
+        troca_doc = produto_troca.model_dump()
+        troca_doc["created_at"] = troca_doc["created_at"].isoformat()
+        await db.produtos.insert_one(troca_doc)
+    await apply_rollup(rollup_ops([doc]))
+    await inc_loja_stats(
+        loja["id"],
+        total_produtos=(1 if venda.possui_troca else 0) - len(produto_ids),
+        total_vendas=1,
+        valor_total_vendas=valor_total
     )
+    await mark_loja_changed(loja["id"], "vendas", "produtos", garantia_ate=garantia_ate)
+    
+    return venda_response(venda_obj.model_dump(), cliente["nome"])
 
 @loja_router.get("/{slug}/vendas/{venda_id}", response_model=VendaConcluidaResponse)
 async def get_venda(slug: str, venda_id: str, payload: dict = Depends(require_loja_access)):
@@ -1532,17 +2667,11 @@ async def get_venda(slug: str, venda_id: str, payload: dict = Depends(require_lo
     if not venda:
         raise HTTPException(status_code=404, detail="Venda não encontrada")
     
-    cliente = await db.clientes.find_one({"id": venda["cliente_id"]}, {"_id": 0})
-    cliente_nome = cliente["nome"] if cliente else "Cliente removido"
-    itens_parsed = json.loads(venda.get("itens", "[]"))
+    cliente_nomes = await get_cliente_nomes([venda["cliente_id"]])
+    cliente_nome = cliente_nomes.get(venda["cliente_id"], "Cliente removido")
     garantia_status = get_garantia_status(venda.get("garantia_ate"))
     
-    return VendaConcluidaResponse(
-        **venda,
-        cliente_nome=cliente_nome,
-        itens_parsed=[VendaItem(**item) for item in itens_parsed],
-        garantia_status=garantia_status
-    )
+    return venda_response(venda, cliente_nome, garantia_status)
 
 # Update Venda (only observacao and forma_pagamento can be updated)
 class VendaUpdate(BaseModel):
@@ -1564,15 +2693,11 @@ async def update_venda(slug: str, venda_id: str, venda_update: VendaUpdate, payl
     await db.vendas_concluidas.update_one({"id": venda_id}, {"$set": update_data})
     
     updated_venda = await db.vendas_concluidas.find_one({"id": venda_id}, {"_id": 0})
-    cliente = await db.clientes.find_one({"id": updated_venda["cliente_id"]}, {"_id": 0})
-    cliente_nome = cliente["nome"] if cliente else "Cliente removido"
-    itens_parsed = json.loads(updated_venda.get("itens", "[]"))
+    cliente_nomes = await get_cliente_nomes([updated_venda["cliente_id"]])
+    cliente_nome = cliente_nomes.get(updated_venda["cliente_id"], "Cliente removido")
     
-    return VendaConcluidaResponse(
-        **updated_venda,
-        cliente_nome=cliente_nome,
-        itens_parsed=[VendaItem(**item) for item in itens_parsed]
-    )
+    await mark_loja_changed(loja["id"], "vendas")
+    return venda_response(updated_venda, cliente_nome)
 
 @loja_router.delete("/{slug}/vendas/{venda_id}")
 async def delete_venda(slug: str, venda_id: str, payload: dict = Depends(require_loja_access)):
@@ -1582,18 +2707,305 @@ async def delete_venda(slug: str, venda_id: str, payload: dict = Depends(require
     if not venda:
         raise HTTPException(status_code=404, detail="Venda não encontrada")
     
-    # Restore products to available (not sold)
-    itens = json.loads(venda.get("itens", "[]"))
-    for item in itens:
-        await db.produtos.update_one({"id": item["produto_id"]}, {"$set": {"vendido": False}})
-    
-    # Delete the sale
-    result = await db.vendas_concluidas.delete_one({"id": venda_id, "loja_id": loja["id"]})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Venda não encontrada")
+    # Restore products to available (not sold) and delete the sale together
+    produto_ids = [item["produto_id"] for item in parse_itens(venda.get("itens"))]
+    restaurar = (
+        {"id": {"$in": produto_ids}, "loja_id": loja["id"]},
+        {"$set": {"vendido": False}, "$unset": {"venda_id": ""}}
+    )
+    venda_filter = {"id": venda_id, "loja_id": loja["id"]}
+    # The deleted document itself says whether the sale was counted in the rollups (the
+    # backfill may have claimed it since the read above)
+    if await supports_transactions():
+        async with await client.start_session() as session:
+            async with session.start_transaction():
+                deleted = await db.vendas_concluidas.find_one_and_delete(venda_filter, session=session)
+                if deleted is None:
+                    raise HTTPException(status_code=404, detail="Venda não encontrada")
+                restore = await db.produtos.update_many(*restaurar, session=session)
+    else:
+        # Standalone mongod: delete first so a concurrent delete can't restore stock twice,
+        # and put the sale back if the restore fails.
+        deleted = await db.vendas_concluidas.find_one_and_delete(venda_filter)
+        if deleted is None:
+            raise HTTPException(status_code=404, detail="Venda não encontrada")
+        try:
+            restore = await db.produtos.update_many(*restaurar)
+        except Exception:
+            await db.vendas_concluidas.insert_one(deleted)
+            raise
+    restaurados = restore.modified_count
+    if deleted.get("rollup"):
+        await apply_rollup(rollup_ops([deleted], -1))
+    await inc_loja_stats(
+        loja["id"],
+        total_produtos=restaurados,
+        total_vendas=-1,
+        valor_total_vendas=-(venda.get("valor_total") or 0)
+    )
+    await mark_loja_changed(loja["id"], "vendas", "produtos")
     
     return {"message": "Venda excluída com sucesso. Produtos retornados ao estoque."}
 
+# ============== EXPORT ==============
+
+# Exportable collections: URL name -> (collection, CSV columns)
+EXPORT_COLLECTIONS = {
+    "produtos": ("produtos", [
+        "id", "modelo_id", "cor", "armazenamento", "memoria", "memoria_ram", "bateria",
+        "imei", "preco", "valor_compra", "vendido", "created_at"
+    ]),
+    "clientes": ("clientes", [
+        "id", "nome", "cpf", "whatsapp", "email", "telefone", "endereco", "created_at"
+    ]),
+    "vendas_concluidas": ("vendas_concluidas", [
+        "id", "data", "cliente_id", "forma_pagamento", "subtotal", "desconto", "valor_total",
+        "observacao", "garantia_meses", "garantia_inicio", "garantia_ate", "itens"
+    ]),
+}
+EXPORT_COLLECTIONS["vendas"] = EXPORT_COLLECTIONS["vendas_concluidas"]
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FLUSH_BYTES = 64 * 1024
+
+def export_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+async def export_rows(cursor, fmt: str, columns: List[str]):
+    """Yield encoded chunks of roughly EXPORT_FLUSH_BYTES straight from a Motor cursor."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer:
+        writer.writerow(columns)
+    async for doc in cursor:
+        if writer:
+            writer.writerow([export_value(doc.get(col)) for col in columns])
+        else:
+            buffer.write(json.dumps(doc, ensure_ascii=False, default=str))
+            buffer.write("\n")
+        if buffer.tell() >= EXPORT_FLUSH_BYTES:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+async def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+@loja_router.get("/{slug}/export/{collection}")
+async def export_collection(
+    slug: str,
+    collection: str,
+    format: str = "ndjson",
+    gzip: bool = False,
+    payload: dict = Depends(require_loja_access)
+):
+    """Stream a full dump of a store collection as NDJSON or CSV (optionally gzipped)."""
+    loja = await verify_loja_access(slug, payload)
+    if collection not in EXPORT_COLLECTIONS:
+        raise HTTPException(status_code=400, detail=f"Coleção inválida. Use: {', '.join(EXPORT_COLLECTIONS)}")
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="Formato inválido. Use ndjson ou csv.")
+    
+    collection_name, columns = EXPORT_COLLECTIONS[collection]
+    cursor = db[collection_name].find({"loja_id": loja["id"]}, {"_id": 0}).batch_size(EXPORT_BATCH_SIZE)
+    body = export_rows(cursor, format, columns)
+    
+    filename = f"{loja['slug']}-{collection_name}.{format}"
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    if gzip:
+        body = gzip_chunks(body)
+        filename += ".gz"
+        media_type = "application/gzip"
+    
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# ============== DATABASE INDEXES ==============
+
+# Managed index registry. Applied idempotently on startup; "routes" lists the
+# handlers that fall back to a collection scan when the index is missing.
+INDEX_REGISTRY = [
+    {"collection": "lojas", "keys": [("id", 1)], "unique": True,
+     "routes": ["GET /api/admin/lojas/{loja_id}", "PUT /api/admin/lojas/{loja_id}", "POST /api/auth/login", "GET /api/auth/me"]},
+    {"collection": "lojas", "keys": [("slug", 1)], "unique": True,
+     "routes": ["/api/loja/{slug}/* (verify_loja_access)", "GET /api/loja/{slug}/verify", "POST /api/admin/lojas"]},
+    {"collection": "usuarios", "keys": [("id", 1)], "unique": True,
+     "routes": ["GET /api/auth/me", "PUT /api/admin/usuarios/{user_id}", "DELETE /api/admin/usuarios/{user_id}"]},
+    {"collection": "usuarios", "keys": [("email", 1)], "unique": True,
+     "routes": ["POST /api/auth/login", "POST /api/admin/usuarios"]},
+    {"collection": "modelos", "keys": [("id", 1)], "unique": True,
+     "routes": ["GET /api/loja/{slug}/modelos/{modelo_id}", "POST /api/loja/{slug}/produtos", "POST /api/loja/{slug}/vendas"]},
+    {"collection": "modelos", "keys": [("loja_id", 1), ("nome", 1)],
+     "routes": ["GET /api/loja/{slug}/modelos", "GET /api/loja/{slug}/dashboard", "POST /api/admin/import/{loja_id}"]},
+    {"collection": "produtos", "keys": [("id", 1)], "unique": True,
+     "routes": ["GET /api/loja/{slug}/produtos/{produto_id}", "POST /api/loja/{slug}/vendas", "DELETE /api/loja/{slug}/vendas/{venda_id}"]},
+    {"collection": "produtos", "keys": [("loja_id", 1), ("vendido", 1), ("modelo_id", 1)],
+     "routes": ["GET /api/loja/{slug}/produtos", "GET /api/loja/{slug}/dashboard", "GET /api/admin/lojas"]},
+    {"collection": "produtos", "keys": [("modelo_id", 1), ("vendido", 1)],
+     "routes": ["GET /api/loja/{slug}/modelos", "GET /api/loja/{slug}/modelos/{modelo_id}", "DELETE /api/loja/{slug}/modelos/{modelo_id}"]},
+    {"collection": "produtos", "keys": [("loja_id", 1), ("imei", 1)],
+     "routes": ["POST /api/admin/import/{loja_id}"]},
+    {"collection": "clientes", "keys": [("id", 1)], "unique": True,
+     "routes": ["GET /api/loja/{slug}/clientes/{cliente_id}", "GET /api/loja/{slug}/vendas", "POST /api/loja/{slug}/vendas"]},
+    {"collection": "clientes", "keys": [("loja_id", 1), ("cpf", 1)],
+     "routes": ["GET /api/loja/{slug}/clientes", "POST /api/admin/import/{loja_id}"]},
+    {"collection": "vendas_concluidas", "keys": [("id", 1)], "unique": True,
+     "routes": ["GET /api/loja/{slug}/vendas/{venda_id}", "PUT /api/loja/{slug}/vendas/{venda_id}", "DELETE /api/loja/{slug}/vendas/{venda_id}"]},
+    {"collection": "vendas_concluidas", "keys": [("loja_id", 1), ("data", -1), ("id", -1)],
+     "routes": ["GET /api/loja/{slug}/vendas", "GET /api/loja/{slug}/dashboard", "GET /api/admin/lojas"]},
+    {"collection": "vendas_concluidas", "keys": [("loja_id", 1), ("forma_pagamento", 1), ("data", -1), ("id", -1)],
+     "routes": ["GET /api/loja/{slug}/vendas?forma_pagamento"]},
+    {"collection": "vendas_concluidas", "keys": [("loja_id", 1), ("cliente_id", 1), ("data", -1), ("id", -1)],
+     "routes": ["GET /api/loja/{slug}/clientes/{cliente_id}/historico", "GET /api/loja/{slug}/vendas?cliente_id"]},
+    {"collection": "import_id_mappings", "keys": [("loja_id", 1)], "unique": True,
+     "routes": ["POST /api/admin/import/{loja_id}"]},
+    {"collection": "vendas_concluidas", "keys": [("loja_id", 1), ("garantia_ate", 1)],
+     "routes": ["GET /api/loja/{slug}/vendas (ETag)"]},
+    {"collection": "vendas_mensais", "keys": [("loja_id", 1), ("mes", 1), ("modelo_id", 1)], "unique": True,
+     "routes": ["GET /api/loja/{slug}/dashboard", "POST /api/loja/{slug}/vendas", "DELETE /api/loja/{slug}/vendas/{venda_id}"]},
+    {"collection": "loja_versions", "keys": [("loja_id", 1)], "unique": True,
+     "routes": ["GET /api/loja/{slug}/produtos", "GET /api/loja/{slug}/clientes", "GET /api/loja/{slug}/modelos", "GET /api/loja/{slug}/vendas", "GET /api/loja/{slug}/dashboard"]},
+    {"collection": "loja_stats", "keys": [("loja_id", 1)], "unique": True,
+     "routes": ["GET /api/loja/{slug}/dashboard", "GET /api/admin/dashboard", "GET /api/admin/lojas"]},
+    {"collection": "import_jobs", "keys": [("id", 1)], "unique": True,
+     "routes": ["GET /api/admin/import/jobs/{job_id}"]},
+    {"collection": "import_jobs", "keys": [("status", 1), ("updated_at", 1)],
+     "routes": ["GET /api/admin/import/jobs/{job_id}"]},
+    {"collection": "request_profiles", "keys": [("id", 1)], "unique": True,
+     "routes": ["GET /api/admin/profiles/{profile_id}"]},
+    {"collection": "request_profiles", "keys": [("at", -1)],
+     "routes": ["GET /api/admin/profiles"]},
+]
+
+def index_name(keys: list) -> str:
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+# Earlier registry entries that a current one extends; dropped so writes stop maintaining both
+RETIRED_INDEXES = [
+    ("vendas_concluidas", [("loja_id", 1), ("forma_pagamento", 1), ("data", -1)]),
+    ("vendas_concluidas", [("loja_id", 1), ("cliente_id", 1), ("data", -1)]),
+]
+
+async def ensure_indexes() -> List[str]:
+    """Create every registered index. Returns the names of indexes that could not be created."""
+    failed = []
+    for collection, keys in RETIRED_INDEXES:
+        try:
+            await db[collection].drop_index(index_name(keys))
+        except OperationFailure:
+            pass  # already gone
+    for spec in INDEX_REGISTRY:
+        name = index_name(spec["keys"])
+        try:
+            await db[spec["collection"]].create_index(spec["keys"], name=name, unique=spec.get("unique", False))
+        except Exception as e:
+            # Usually duplicated data blocking a unique index; keep the app running.
+            logger.error(f"Falha ao criar índice {spec['collection']}.{name}: {e}")
+            failed.append(f"{spec['collection']}.{name}")
+    return failed
+
+class IndexStatus(BaseModel):
+    collection: str
+    name: str
+    keys: List[List]
+    unique: bool = False
+    present: bool
+    routes: List[str]
+
+class IndexReport(BaseModel):
+    healthy: bool
+    missing: int
+    indexes: List[IndexStatus]
+    collection_scan_routes: List[str]
+
+@admin_router.get("/indexes", response_model=IndexReport)
+async def index_health(payload: dict = Depends(require_super_admin)):
+    existing = {}
+    for collection in {spec["collection"] for spec in INDEX_REGISTRY}:
+        info = await db[collection].index_information()
+        existing[collection] = {
+            tuple((field, int(direction)) for field, direction in idx["key"]): idx.get("unique", False)
+            for idx in info.values()
+        }
+
+    indexes = []
+    scan_routes = set()
+    for spec in INDEX_REGISTRY:
+        keys = tuple(spec["keys"])
+        unique = spec.get("unique", False)
+        present = keys in existing[spec["collection"]] and existing[spec["collection"]][keys] == unique
+        if not present:
+            scan_routes.update(spec["routes"])
+        indexes.append(IndexStatus(
+            collection=spec["collection"],
+            name=index_name(spec["keys"]),
+            keys=[list(k) for k in spec["keys"]],
+            unique=unique,
+            present=present,
+            routes=spec["routes"]
+        ))
+
+    missing = len([i for i in indexes if not i.present])
+    return IndexReport(
+        healthy=missing == 0,
+        missing=missing,
+        indexes=indexes,
+        collection_scan_routes=sorted(scan_routes)
+    )
+
+# ============== MIGRATIONS ==============
+
+async def run_startup_migrations():
+    try:
+        orphaned = await fail_stale_import_jobs()
+        if orphaned:
+            logger.warning(f"{orphaned} importações interrompidas marcadas como falhas")
+    except Exception as e:
+        logger.error(f"Verificação de importações interrompidas falhou: {e}", exc_info=True)
+    try:
+        converted = await migrate_vendas_itens()
+        if converted:
+            logger.info(f"Migração de itens de vendas: {converted} vendas convertidas")
+    except Exception as e:
+        logger.error(f"Migração de itens de vendas falhou: {e}", exc_info=True)
+    try:
+        # Until one full backfill has finished, fold the sales history into the rollups
+        if not await db.migrations.find_one({"_id": ROLLUP_BACKFILL_LOCK}):
+            counted = await backfill_vendas_mensais()
+            if counted:
+                await invalidate_dashboard()
+            if counted is not None:
+                logger.info(f"Rollups mensais de vendas: {counted} vendas do histórico contabilizadas")
+    except Exception as e:
+        logger.error(f"Backfill dos rollups mensais falhou: {e}", exc_info=True)
+
+@admin_router.post("/migrations/vendas-itens")
+async def migrate_vendas_itens_endpoint(payload: dict = Depends(require_super_admin)):
+    converted = await migrate_vendas_itens()
+    remaining = await db.vendas_concluidas.count_documents({"itens": {"$type": "string"}})
+    return {"converted": converted, "remaining": remaining}
+
+@admin_router.post("/migrations/vendas-mensais")
+async def backfill_vendas_mensais_endpoint(loja_id: Optional[str] = None, payload: dict = Depends(require_super_admin)):
+    counted = await backfill_vendas_mensais(loja_id)
+    if counted is None:
+        raise HTTPException(status_code=409, detail="Backfill dos rollups mensais já em andamento")
+    await invalidate_dashboard(loja_id)
+    return {"vendas": counted}
+
 # ============== ROOT ==============
 
 @api_router.get("/")
@@ -1632,6 +3044,437 @@ async def upload_logo(file: UploadFile = File(...), payload: dict = Depends(veri
     # Return the URL path
     return {"url": f"/api/uploads/{unique_filename}", "filename": unique_filename}
 
+# ============== COMPRESSION ==============
+
+class GzipEncoder:
+    def __init__(self):
+        self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def encode(self, data: bytes, final: bool) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+class BrotliEncoder:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def encode(self, data: bytes, final: bool) -> bytes:
+        out = self.compressor.process(data)
+        return out + (self.compressor.finish() if final else self.compressor.flush())
+
+class ZstdEncoder:
+    def __init__(self):
+        self.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def encode(self, data: bytes, final: bool) -> bytes:
+        mode = zstandard.COMPRESSOBJ_FLUSH_FINISH if final else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        return self.compressor.compress(data) + self.compressor.flush(mode)
+
+ENCODERS = {"gzip": GzipEncoder}
+if brotli is not None:
+    ENCODERS["br"] = BrotliEncoder
+if zstandard is not None:
+    ENCODERS["zstd"] = ZstdEncoder
+
+# Already-compressed payloads are passed through untouched
+INCOMPRESSIBLE_TYPES = ("image/", "video/", "audio/", "application/gzip", "application/zip", "application/octet-stream")
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the first server-preferred encoding the client accepts with q > 0."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    for encoding in COMPRESSION_ENCODINGS:
+        if encoding in ENCODERS and accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+class CompressionMiddleware:
+    """
+    Negotiated gzip/br/zstd compression. Single-body responses below COMPRESSION_MIN_SIZE
+    are sent as-is; streaming responses are compressed chunk by chunk (flushed per chunk),
+    so exports keep streaming.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = ""
+        for key, value in scope["headers"]:
+            if key == b"accept-encoding":
+                accept = value.decode("latin-1")
+        encoding = negotiate_encoding(accept) if accept else None
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        encoder = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, encoder, passthrough
+            if message["type"] == "http.response.start":
+                start_headers = {k.lower(): v for k, v in message.get("headers", [])}
+                content_type = start_headers.get(b"content-type", b"").decode("latin-1")
+                passthrough = (
+                    message["status"] < 200 or message["status"] in (204, 304)
+                    or b"content-encoding" in start_headers
+                    or content_type.startswith(INCOMPRESSIBLE_TYPES)
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                raw_headers = [(k, v) for k, v in start_message.get("headers", []) if k.lower() != b"content-length"]
+                if not more_body and len(body) < COMPRESSION_MIN_SIZE:
+                    passthrough = True
+                    start_message["headers"] = list(start_message.get("headers", [])) + [(b"vary", b"Accept-Encoding")]
+                    await send(start_message)
+                    await send(message)
+                    return
+                encoder = ENCODERS[encoding]()
+                payload = encoder.encode(body, final=not more_body)
+                headers = []
+                for key, value in raw_headers:
+                    if key.lower() == b"etag" and not value.startswith(b"W/"):
+                        value = b"W/" + value  # the strong tag names the identity representation
+                    headers.append((key, value))
+                headers.append((b"content-encoding", encoding.encode()))
+                headers.append((b"vary", b"Accept-Encoding"))
+                if not more_body:
+                    headers.append((b"content-length", str(len(payload)).encode()))
+                start_message["headers"] = headers
+                await send(start_message)
+                await send({"type": "http.response.body", "body": payload, "more_body": more_body})
+                return
+            await send({"type": "http.response.body", "body": encoder.encode(body, final=not more_body), "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+# ============== METRICS ==============
+
+class MetricsMiddleware:
+    """Per-route latency histogram, status counter and in-flight gauge (route = path template)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight = HTTP_IN_FLIGHT.labels(method)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+
+class QueryCountMiddleware:
+    """
+    Adds X-DB-Queries and Server-Timing (db;dur=...) with the Mongo commands issued
+    before the response started. Used by the query-budget tests to catch N+1 patterns.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = []
+        token = db_query_stats.set(stats)
+        scope_token = request_scope.set(scope)
+
+        async def send_with_counts(message):
+            if message["type"] == "http.response.start":
+                duration_ms = sum(stats) / 1000
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-db-queries", str(len(stats)).encode()),
+                    (b"server-timing", f'db;dur={duration_ms:.1f};desc="{len(stats)} queries"'.encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_counts)
+        finally:
+            db_query_stats.reset(token)
+            request_scope.reset(scope_token)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+# ============== SLOW QUERIES ==============
+
+# Driver-added fields that must not be sent back inside an explain command
+COMMAND_META_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "readConcern", "writeConcern", "apiVersion"}
+
+def command_filter(command_name: str, command: dict):
+    """The selection part of a command (never inserted documents or update bodies)."""
+    if command_name == "find":
+        return command.get("filter", {})
+    if command_name == "aggregate":
+        return command.get("pipeline", [])
+    if command_name in ("count", "distinct", "findAndModify"):
+        return command.get("query", {})
+    if command_name == "update":
+        return [u.get("q") for u in command.get("updates", [])]
+    if command_name == "delete":
+        return [d.get("q") for d in command.get("deletes", [])]
+    return None
+
+def query_shape(value):
+    """Filter with values blanked, so one explain covers every query of the same shape."""
+    if isinstance(value, dict):
+        return {k: query_shape(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [query_shape(v) for v in value]
+    return "?"
+
+def summarize_explain(explain: dict) -> dict:
+    """Pull the winning plan stages and executionStats counters out of an explain document."""
+    summary = {}
+
+    def walk(node):
+        if isinstance(node, list):
+            for item in node:
+                walk(item)
+            return
+        if not isinstance(node, dict):
+            return
+        if "executionStats" in node and "execution_stats" not in summary:
+            stats = node["executionStats"]
+            summary["execution_stats"] = {
+                key: stats.get(key)
+                for key in ("nReturned", "executionTimeMillis", "totalKeysExamined", "totalDocsExamined")
+            }
+        if "winningPlan" in node and "plan" not in summary:
+            stages = []
+            plan = node["winningPlan"].get("queryPlan", node["winningPlan"])
+            while isinstance(plan, dict):
+                stages.append(plan.get("stage", "?") + (f"({plan['indexName']})" if plan.get("indexName") else ""))
+                plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+            summary["plan"] = " <- ".join(stages)
+        for value in node.values():
+            walk(value)
+
+    walk(explain)
+    return summary
+
+class SlowQueryRecorder:
+    """
+    Keeps the last SLOW_QUERY_LOG_SIZE Mongo commands slower than SLOW_QUERY_MS.
+    find/aggregate entries get an explain("executionStats") sample, at most one per
+    query shape every SLOW_QUERY_EXPLAIN_INTERVAL seconds.
+    """
+
+    EXPLAINABLE = ("find", "aggregate")
+
+    def __init__(self, maxsize: int):
+        self.entries = deque(maxlen=maxsize)
+        self.last_explain = {}
+        self.loop = None
+
+    def observe(self, collection: str, command_name: str, command: dict, duration_micros: int):
+        scope = request_scope.get()
+        route = None
+        if scope is not None:
+            route = getattr(scope.get("route"), "path", None) or scope.get("path")
+        filtro = json.loads(json.dumps(command_filter(command_name, command), default=str))
+        entry = {
+            "id": str(uuid.uuid4()),
+            "at": datetime.now(timezone.utc).isoformat(),
+            "collection": collection,
+            "command": command_name,
+            "duration_ms": round(duration_micros / 1000, 2),
+            "filter": filtro,
+            "route": route,
+            "explain": None,
+        }
+        self.entries.append(entry)
+        if SLOW_QUERY_EXPLAIN and command_name in self.EXPLAINABLE and self.loop is not None:
+            shape = (collection, command_name, json.dumps(query_shape(filtro), sort_keys=True))
+            now = time.monotonic()
+            if now - self.last_explain.get(shape, -SLOW_QUERY_EXPLAIN_INTERVAL) >= SLOW_QUERY_EXPLAIN_INTERVAL:
+                self.last_explain[shape] = now
+                explain_command = {k: v for k, v in command.items() if not k.startswith("$") and k not in COMMAND_META_FIELDS}
+                # Listener callbacks run on driver threads that carry the request's context
+                # (Motor copies it); start the explain on the app loop in an empty context so
+                # it is not counted in that request's X-DB-Queries or attributed to its route.
+                self.loop.call_soon_threadsafe(
+                    self.start_explain, entry, explain_command, context=contextvars.Context()
+                )
+
+    def start_explain(self, entry: dict, command: dict):
+        spawn_background(self.explain(entry, command))
+
+    async def explain(self, entry: dict, command: dict):
+        try:
+            result = await db.command({"explain": command, "verbosity": "executionStats"})
+            entry["explain"] = summarize_explain(result)
+        except Exception as e:
+            entry["explain"] = {"error": str(e)}
+
+    def recent(self, collection: Optional[str] = None, limit: int = 50) -> list:
+        entries = [e for e in reversed(self.entries) if not collection or e["collection"] == collection]
+        return entries[:limit]
+
+slow_queries = SlowQueryRecorder(SLOW_QUERY_LOG_SIZE)
+
+@admin_router.get("/slow-queries")
+async def list_slow_queries(
+    collection: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=1000),
+    payload: dict = Depends(require_super_admin)
+):
+    """
+    Most recent slow Mongo commands, newest first. The log is kept in memory by each
+    worker, so this only lists the commands run by the worker that serves the request
+    (its pid is in "worker"); repeat the call to sample the others.
+    """
+    return {
+        "worker": os.getpid(),
+        "threshold_ms": SLOW_QUERY_MS,
+        "total": len(slow_queries.entries),
+        "queries": slow_queries.recent(collection, limit),
+    }
+
+@admin_router.delete("/slow-queries")
+async def clear_slow_queries(payload: dict = Depends(require_super_admin)):
+    """Clear the slow-query log of the worker that serves the request."""
+    slow_queries.entries.clear()
+    slow_queries.last_explain.clear()
+    return {"message": "Registro de consultas lentas limpo"}
+
+# ============== PROFILING ==============
+
+async def store_profile(meta: dict, session):
+    """
+    Keep the profile in Mongo so whichever worker serves GET /api/admin/profiles/{id} finds
+    it; only the newest PROFILE_STORE_SIZE are kept. The session is stored as a JSON string
+    because pyinstrument's frame attributes are not valid Mongo field names.
+    """
+    await db.request_profiles.insert_one({**meta, "session": json.dumps(session.to_json())})
+    oldest_kept = await db.request_profiles.find({}, {"_id": 0, "at": 1}).sort("at", -1).skip(PROFILE_STORE_SIZE - 1).limit(1).to_list(1)
+    if oldest_kept:
+        await db.request_profiles.delete_many({"at": {"$lt": oldest_kept[0]["at"]}})
+
+async def profile_requested(scope) -> bool:
+    """Cheap flag check first; the token is only looked at when the flag is present."""
+    flagged = b"profile=1" in scope.get("query_string", b"")
+    authorization = None
+    for key, value in scope["headers"]:
+        if key == b"x-profile" and value == b"1":
+            flagged = True
+        elif key == b"authorization":
+            authorization = value.decode("latin-1")
+    if not flagged or not authorization or not authorization.startswith("Bearer "):
+        return False
+    try:
+        payload = await verify_token(HTTPAuthorizationCredentials(scheme="Bearer", credentials=authorization[7:]))
+    except HTTPException:
+        return False
+    return payload.get("role") == "super_admin"
+
+class ProfilerMiddleware:
+    """
+    Runs pyinstrument (async-aware sampling) for a single request when a super admin asks
+    for it. The profile is stored in Mongo and its id returned in X-Profile-Id; fetch it
+    from GET /api/admin/profiles/{id} as speedscope JSON or HTML, on any worker.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or Profiler is None or not await profile_requested(scope):
+            await self.app(scope, receive, send)
+            return
+        profile_id = str(uuid.uuid4())
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            session = profiler.stop()
+            meta = {
+                "id": profile_id,
+                "at": datetime.now(timezone.utc).isoformat(),
+                "method": scope["method"],
+                "path": scope["path"],
+                "duration_ms": round(session.duration * 1000, 2),
+                "samples": session.sample_count,
+            }
+            try:
+                await store_profile(meta, session)
+            except Exception as e:
+                logger.error(f"Falha ao gravar perfil {profile_id}: {e}", exc_info=True)
+
+@admin_router.get("/profiles")
+async def list_profiles(payload: dict = Depends(require_super_admin)):
+    """Stored request profiles, newest first."""
+    return await db.request_profiles.find({}, {"_id": 0, "session": 0}).sort("at", -1).to_list(PROFILE_STORE_SIZE)
+
+@admin_router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, format: str = "speedscope", payload: dict = Depends(require_super_admin)):
+    """Download a profile as speedscope JSON (flamegraph, https://speedscope.app) or pyinstrument HTML."""
+    if format not in ("speedscope", "html"):
+        raise HTTPException(status_code=400, detail="Formato inválido. Use speedscope ou html.")
+    profile = await db.request_profiles.find_one({"id": profile_id}, {"_id": 0, "session": 1})
+    if not profile:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    session = Session.from_json(json.loads(profile["session"]))
+    if format == "html":
+        return Response(HTMLRenderer().render(session), media_type="text/html")
+    return Response(
+        SpeedscopeRenderer().render(session),
+        media_type="application/json",
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.speedscope.json"'}
+    )
+
 # Include routers
 app.include_router(api_router)
 app.include_router(admin_router)
@@ -1646,7 +3489,12 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Cache", "ETag", "X-DB-Queries", "Server-Timing", "X-Profile-Id"],
 )
+app.add_middleware(ProfilerMiddleware)
+app.add_middleware(QueryCountMiddleware)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 # Configure logging
 logging.basicConfig(
@@ -1657,6 +3505,16 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("startup")
 async def startup_event():
+    slow_queries.loop = asyncio.get_running_loop()
+
+    # Apply managed indexes (idempotent)
+    failed_indexes = await ensure_indexes()
+    if failed_indexes:
+        logger.warning(f"Índices não criados: {', '.join(failed_indexes)}")
+
+    # Convert legacy data shapes without blocking startup
+    spawn_background(run_startup_migrations())
+
     # Create super admin if not exists
     existing_admin = await db.usuarios.find_one({"role": "super_admin"}, {"_id": 0})
     if not existing_admin:
@@ -1664,7 +3522,7 @@ async def startup_event():
             "id": str(uuid.uuid4()),
             "email": "superadmin@cellcontrol.com",
             "nome": "Super Admin",
-            "senha": "admin123",
+            "senha": await hash_password("admin123"),
             "role": "super_admin",
             "loja_id": None,
             "ativo": True,
@@ -1694,7 +3552,7 @@ async def startup_event():
                 "id": str(uuid.uuid4()),
                 "email": "admin@isaacimports.com",
                 "nome": "Admin Isaac",
-                "senha": "123456",
+                "senha": await hash_password("123456"),
                 "role": "loja_admin",
                 "loja_id": loja_id,
                 "ativo": True,
@@ -1703,6 +3561,15 @@ async def startup_event():
             await db.usuarios.insert_one(loja_admin)
             logger.info("Admin da loja criado: admin@isaacimports.com / 123456")
 
+    # Counters must exist before any write path runs (see build_missing_loja_stats)
+    built = await build_missing_loja_stats()
+    while built is None:
+        await asyncio.sleep(0.5)
+        built = await build_missing_loja_stats()
+    if built:
+        logger.info(f"Contadores de {built} lojas calculados")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+    password_executor.shutdown(wait=False)
@@ -22,6 +22,10 @@ import {
 } from "lucide-react";
 import { toast } from "sonner";
 
+// A little longer than the server-side IMPORT_JOB_STALE_SECONDS default (600 s), so the
+// server normally reports the orphaned job as failed first
+const IMPORT_STALL_TIMEOUT_MS = 11 * 60 * 1000;
+
 const AdminImport = () => {
   const fileInputRef = useRef(null);
   const [lojas, setLojas] = useState([]);
@@ -60,6 +64,25 @@ const AdminImport = () => {
     setResult(null);
   };
 
+  const waitForImportJob = async (jobId) => {
+    // Give up when the job shows no progress for IMPORT_STALL_TIMEOUT_MS
+    let lastUpdate = null;
+    let lastChange = Date.now();
+    while (true) {
+      const response = await axios.get(`${API}/admin/import/jobs/${jobId}`);
+      if (response.data.status === 'done' || response.data.status === 'failed') {
+        return response.data;
+      }
+      if (response.data.updated_at !== lastUpdate) {
+        lastUpdate = response.data.updated_at;
+        lastChange = Date.now();
+      } else if (Date.now() - lastChange > IMPORT_STALL_TIMEOUT_MS) {
+        throw { response: { data: { detail: "A importação parou de responder. Verifique o resultado e tente novamente." } } };
+      }
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+    }
+  };
+
   const handleImport = async () => {
     if (!selectedLoja) {
       toast.error("Selecione uma loja");
@@ -84,12 +107,18 @@ const AdminImport = () => {
         { headers: { 'Content-Type': 'multipart/form-data' } }
       );
 
-      setResult(response.data);
+      // Import runs in background; poll the job until it finishes
+      const job = await waitForImportJob(response.data.job_id);
+      if (job.status === 'failed') {
+        throw { response: { data: { detail: job.error } } };
+      }
+
+      setResult(job.result);
       
-      if (response.data.success) {
-        toast.success(`${response.data.imported} registros importados com sucesso!`);
+      if (job.result.success) {
+        toast.success(`${job.result.imported} registros importados com sucesso!`);
       } else {
-        toast.warning(`Importação concluída com ${response.data.errors.length} erros`);
+        toast.warning(`Importação concluída com ${job.result.details?.error_count ?? job.result.errors.length} erros`);
       }
     } catch (error) {
       const message = error.response?.data?.detail || "Erro ao importar dados";
@@ -0,0 +1,66 @@
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Throwaway database per run (load_dotenv does not override variables already set)
+os.environ["DB_NAME"] = os.environ.get("TEST_DB_NAME", f"cellcontrol_test_{uuid.uuid4().hex[:8]}")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+
+@pytest.fixture(scope="session")
+def client():
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    load_dotenv(BACKEND_DIR / ".env")
+    mongo = MongoClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=2000)
+    try:
+        mongo.admin.command("ping")
+    except PyMongoError as e:
+        pytest.skip(f"MongoDB indisponível: {e}")
+
+    from fastapi.testclient import TestClient
+    import server
+
+    with TestClient(server.app) as test_client:
+        yield test_client
+    mongo.drop_database(os.environ["DB_NAME"])
+    mongo.close()
+
+
+def login(client, email: str, senha: str) -> dict:
+    response = client.post("/api/auth/login", json={"email": email, "senha": senha})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['token']}"}
+
+
+@pytest.fixture(scope="session")
+def admin_headers(client):
+    return login(client, "superadmin@cellcontrol.com", "admin123")
+
+
+@pytest.fixture(scope="session")
+def loja_headers(client):
+    return login(client, "admin@isaacimports.com", "123456")
+
+
+@pytest.fixture
+def max_queries():
+    """
+    Assert a response stayed within a Mongo query budget (X-DB-Queries header).
+    Usage: max_queries(client.get(url, headers=h), 4)
+    """
+    def check(response, limit: int) -> int:
+        assert response.status_code < 400, response.text
+        count = int(response.headers["X-DB-Queries"])
+        request = response.request
+        assert count <= limit, f"{request.method} {request.url.path} fez {count} consultas (máximo {limit})"
+        return count
+    return check
@@ -0,0 +1,17 @@
+"""Cached dashboards must not outlive writes handled by another worker."""
+
+SLUG = "isaacimports"
+BASE = f"/api/loja/{SLUG}"
+
+
+def test_dashboard_cache_follows_shared_versions(client, admin_headers, loja_headers):
+    import server
+
+    loja_id = next(l["id"] for l in client.get("/api/admin/lojas", headers=admin_headers).json() if l["slug"] == SLUG)
+    client.post(f"{BASE}/modelos", json={"nome": "Modelo Cache Dashboard"}, headers=loja_headers)
+    assert client.get(f"{BASE}/dashboard", headers=loja_headers).headers["X-Cache"] == "MISS"
+    assert client.get(f"{BASE}/dashboard", headers=loja_headers).headers["X-Cache"] == "HIT"
+
+    # Another worker's write only shows up here through loja_versions
+    client.portal.call(server.db.loja_versions.update_one, {"loja_id": loja_id}, {"$inc": {"vendas": 1}})
+    assert client.get(f"{BASE}/dashboard", headers=loja_headers).headers["X-Cache"] == "MISS"
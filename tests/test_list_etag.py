@@ -0,0 +1,63 @@
+"""ETag revalidation of the store lists must not outlive time-dependent fields."""
+from datetime import datetime, timedelta
+
+SLUG = "isaacimports"
+BASE = f"/api/loja/{SLUG}"
+
+
+def shift_clock(monkeypatch, delta: timedelta):
+    import server
+
+    class ShiftedDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.now(tz) + delta
+
+    monkeypatch.setattr(server, "datetime", ShiftedDatetime)
+
+
+def sell(client, headers, cpf: str, **venda) -> str:
+    """Create a model, a product and a customer, sell the product and return the sale id."""
+    modelo = client.post(f"{BASE}/modelos", json={"nome": f"Modelo Garantia {cpf}"}, headers=headers).json()
+    produto = client.post(f"{BASE}/produtos", json={
+        "modelo_id": modelo["id"], "cor": "Azul", "armazenamento": "64GB", "preco": 900
+    }, headers=headers).json()
+    cliente = client.post(f"{BASE}/clientes", json={
+        "nome": f"Cliente Garantia {cpf}", "cpf": cpf, "whatsapp": "11988887777"
+    }, headers=headers).json()
+    response = client.post(f"{BASE}/vendas", json={
+        "cliente_id": cliente["id"], "produtos": [produto["id"]], "forma_pagamento": "pix", **venda
+    }, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def assert_expires(client, headers, monkeypatch, venda_id: str):
+    def status_of(response):
+        return next(v["garantia_status"] for v in response.json() if v["id"] == venda_id)
+
+    first = client.get(f"{BASE}/vendas", headers=headers)
+    assert status_of(first) == "ativa"
+    etag = first.headers["ETag"]
+    assert client.get(f"{BASE}/vendas", headers={**headers, "If-None-Match": etag}).status_code == 304
+
+    shift_clock(monkeypatch, timedelta(days=40))
+    expired = client.get(f"{BASE}/vendas", headers={**headers, "If-None-Match": etag})
+    assert expired.status_code == 200
+    assert expired.headers["ETag"] != etag
+    assert status_of(expired) == "vencida"
+
+
+def test_vendas_etag_changes_when_garantia_expires(client, loja_headers, monkeypatch):
+    venda_id = sell(client, loja_headers, "98765432100", garantia_meses=1)
+    assert_expires(client, loja_headers, monkeypatch, venda_id)
+
+
+def test_garantia_from_before_loja_versions_is_tracked(client, loja_headers, monkeypatch):
+    """A warranty sale written before loja_versions existed (older deploy, import) still expires the ETag."""
+    import server
+
+    venda_id = sell(client, loja_headers, "98765432101", garantia_meses=1)
+    client.portal.call(server.db.loja_versions.delete_many, {})
+    sell(client, loja_headers, "98765432102")
+    assert_expires(client, loja_headers, monkeypatch, venda_id)
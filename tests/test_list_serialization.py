@@ -0,0 +1,86 @@
+"""The fast list path (trusted rows + orjson) must render rows exactly like the validated detail endpoints."""
+import json
+import time
+
+import pytest
+
+SLUG = "isaacimports"
+BASE = f"/api/loja/{SLUG}"
+
+
+def canonical(value) -> str:
+    # json.dumps keeps 85 vs "85" and 1000 vs 1000.0 apart
+    return json.dumps(value, sort_keys=True)
+
+
+def import_file(client, admin_headers, loja_id: str, data_type: str, records: list):
+    response = client.post(
+        f"/api/admin/import/{loja_id}", params={"data_type": data_type}, headers=admin_headers,
+        files={"file": (f"{data_type}.json", json.dumps(records).encode(), "application/json")}
+    )
+    assert response.status_code == 202, response.text
+    job_id = response.json()["job_id"]
+    for _ in range(100):
+        job = client.get(f"/api/admin/import/jobs/{job_id}", headers=admin_headers).json()
+        if job["status"] in ("done", "failed"):
+            break
+        time.sleep(0.05)
+    assert job["status"] == "done" and job["imported"] == len(records), job
+
+
+@pytest.fixture(scope="module")
+def rows(client, admin_headers, loja_headers):
+    """Create one of each through the API and import more through the admin importer."""
+    modelo = client.post(f"{BASE}/modelos", json={"nome": "Modelo Serializacao"}, headers=loja_headers).json()
+    produto = client.post(f"{BASE}/produtos", json={
+        "modelo_id": modelo["id"], "cor": "Verde", "armazenamento": "256GB", "bateria": 91, "preco": 1500
+    }, headers=loja_headers).json()
+    cliente = client.post(f"{BASE}/clientes", json={
+        "nome": "Cliente Serializacao", "cpf": "11122233344", "whatsapp": "11911112222"
+    }, headers=loja_headers).json()
+    venda = client.post(f"{BASE}/vendas", json={
+        "cliente_id": cliente["id"], "produtos": [produto["id"]], "forma_pagamento": "pix", "garantia_meses": 3
+    }, headers=loja_headers)
+    assert venda.status_code == 200, venda.text
+
+    loja_id = next(l["id"] for l in client.get("/api/admin/lojas", headers=admin_headers).json() if l["slug"] == SLUG)
+    import_file(client, admin_headers, loja_id, "produtos", [
+        {"modelo": "Modelo Serializacao", "cor": "Preto", "memoria": "128GB", "bateria": "85", "preco": "1200", "imei": "359000000000001"},
+        {"modelo": "Modelo Serializacao", "cor": "Branco", "memoria": "64GB", "preco": "R$ 899,90"},
+    ])
+    import_file(client, admin_headers, loja_id, "clientes", [
+        {"nome": "Cliente Importado", "cpf": "55566677788", "whatsapp": "11933334444"},
+    ])
+    import_file(client, admin_headers, loja_id, "vendas", [
+        {"cliente_nome": "Cliente Importado", "valor_total": "2500", "data": "2024-03-05 14:20:00", "forma_pagamento": "Cartão"},
+        {"cliente_nome": "Cliente Importado", "valor_total": "10", "data": "05/04/2024"},
+    ])
+    return {"modelo_id": modelo["id"]}
+
+
+@pytest.fixture(params=[True, False], ids=["fast", "validated"])
+def list_path(request, monkeypatch):
+    import server
+    monkeypatch.setattr(server, "FAST_JSON_LISTS", request.param)
+
+
+@pytest.mark.parametrize("lista,query", [
+    ("produtos", {}),
+    ("clientes", {}),
+    ("vendas", {}),
+])
+def test_list_rows_match_detail(client, loja_headers, rows, list_path, lista, query):
+    listed = client.get(f"{BASE}/{lista}", params=query, headers=loja_headers)
+    assert listed.status_code == 200, listed.text
+    assert listed.json()
+    for row in listed.json():
+        detail = client.get(f"{BASE}/{lista}/{row['id']}", headers=loja_headers)
+        assert detail.status_code == 200, detail.text
+        assert canonical(row) == canonical(detail.json())
+
+
+def test_modelo_row_matches_detail(client, loja_headers, rows, list_path):
+    listed = client.get(f"{BASE}/modelos", headers=loja_headers).json()
+    row = next(m for m in listed if m["id"] == rows["modelo_id"])
+    detail = client.get(f"{BASE}/modelos/{rows['modelo_id']}", headers=loja_headers).json()
+    assert canonical(row) == canonical(detail)
@@ -0,0 +1,41 @@
+"""Store counters (loja_stats) must exist without a manual repair and match the source collections."""
+
+SLUG = "isaacimports"
+BASE = f"/api/loja/{SLUG}"
+
+
+def stored_and_real(client, loja_id: str):
+    import server
+
+    stored = client.portal.call(server.db.loja_stats.find_one, {"loja_id": loja_id}, {"_id": 0})
+    real = client.portal.call(server.get_lojas_stats, [loja_id]).get(loja_id, {})
+    return stored, {**server.empty_loja_stats(), **real}
+
+
+def loja_id_of(client, admin_headers) -> str:
+    return next(l["id"] for l in client.get("/api/admin/lojas", headers=admin_headers).json() if l["slug"] == SLUG)
+
+
+def test_startup_builds_missing_counters(client, admin_headers):
+    import server
+
+    loja_id = loja_id_of(client, admin_headers)
+    client.portal.call(server.db.loja_stats.delete_many, {})
+    assert client.portal.call(server.build_missing_loja_stats) >= 1
+    stored, real = stored_and_real(client, loja_id)
+    assert {field: stored[field] for field in server.LOJA_STATS_FIELDS} == real
+    assert client.portal.call(server.build_missing_loja_stats) == 0
+
+
+def test_write_rebuilds_removed_counters(client, admin_headers, loja_headers):
+    import server
+
+    loja_id = loja_id_of(client, admin_headers)
+    client.portal.call(server.db.loja_stats.delete_many, {"loja_id": loja_id})
+    response = client.post(f"{BASE}/clientes", json={
+        "nome": "Cliente Contadores", "cpf": "30000000001", "whatsapp": "11955554444"
+    }, headers=loja_headers)
+    assert response.status_code == 200, response.text
+    stored, real = stored_and_real(client, loja_id)
+    assert stored is not None
+    assert {field: stored[field] for field in server.LOJA_STATS_FIELDS} == real
@@ -0,0 +1,21 @@
+"""Request profiles must be retrievable from any worker, not just the one that recorded them."""
+import pytest
+
+pytest.importorskip("pyinstrument")
+
+SLUG = "isaacimports"
+
+
+def test_profile_is_shared_through_mongo(client, admin_headers):
+    import server
+
+    response = client.get(f"/api/loja/{SLUG}/vendas", params={"profile": "1"}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    profile_id = response.headers["X-Profile-Id"]
+    # What another worker would find: only the stored document
+    assert client.portal.call(server.db.request_profiles.find_one, {"id": profile_id})
+
+    assert profile_id in [p["id"] for p in client.get("/api/admin/profiles", headers=admin_headers).json()]
+    speedscope = client.get(f"/api/admin/profiles/{profile_id}", headers=admin_headers)
+    assert speedscope.status_code == 200
+    assert speedscope.json()["$schema"].startswith("https://www.speedscope.app")
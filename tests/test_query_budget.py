@@ -0,0 +1,49 @@
+"""Query budgets for the list endpoints: the count must not grow with the number of rows."""
+import pytest
+
+SLUG = "isaacimports"
+
+
+def seed(client, headers, n: int):
+    base = f"/api/loja/{SLUG}"
+    modelos = [client.post(f"{base}/modelos", json={"nome": f"Modelo {i}"}, headers=headers).json() for i in range(n)]
+    produtos = [
+        client.post(f"{base}/produtos", json={
+            "modelo_id": modelos[i % n]["id"], "cor": "Preto", "armazenamento": "128GB", "preco": 1000 + i
+        }, headers=headers).json()
+        for i in range(2 * n)
+    ]
+    clientes = [
+        client.post(f"{base}/clientes", json={
+            "nome": f"Cliente {i}", "cpf": f"{i:011d}", "whatsapp": "11999999999"
+        }, headers=headers).json()
+        for i in range(n)
+    ]
+    for i in range(n):
+        response = client.post(f"{base}/vendas", json={
+            "cliente_id": clientes[i]["id"], "produtos": [produtos[2 * i]["id"]], "forma_pagamento": "pix"
+        }, headers=headers)
+        assert response.status_code == 200, response.text
+
+
+LIST_BUDGETS = [
+    ("/api/loja/{slug}/modelos", 4),
+    ("/api/loja/{slug}/produtos", 4),
+    ("/api/loja/{slug}/clientes", 3),
+    ("/api/loja/{slug}/vendas", 4),
+    ("/api/loja/{slug}/dashboard", 8),
+]
+
+
+@pytest.mark.parametrize("path,limit", LIST_BUDGETS)
+def test_loja_list_query_budget(client, loja_headers, max_queries, path, limit):
+    url = path.format(slug=SLUG)
+    seed(client, loja_headers, 3)
+    small = max_queries(client.get(url, headers=loja_headers), limit)
+    seed(client, loja_headers, 10)
+    large = max_queries(client.get(url, headers=loja_headers), limit)
+    assert large <= small, f"{url}: {small} -> {large} consultas com mais registros (N+1?)"
+
+
+def test_list_usuarios_query_budget(client, admin_headers, max_queries):
+    max_queries(client.get("/api/admin/usuarios", headers=admin_headers), 2)